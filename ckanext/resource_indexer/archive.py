@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import logging
+import os
+import tarfile
+import tempfile
+import zipfile
+from collections.abc import Iterator
+from typing import IO, Any, Iterable, NamedTuple, Optional
+
+from . import config, exc, sniff, utils
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = {"zip", "gz", "gzip", "tgz", "tar", "tar.gz"}
+CHUNK_SIZE = 1024 * 64
+
+
+class Member(NamedTuple):
+    """Data extracted from the single file inside archive."""
+
+    resource: dict[str, Any]
+    handler: Any
+    chunks: Any
+
+
+class Limits:
+    """Guard against archive bombs.
+
+    Tracks the number of processed members and the total amount of
+    decompressed data. Sizes declared by archive are checked before
+    decompression, but real amount of data is counted as well, because
+    headers can lie.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.max_members = config.archive_max_members()
+        self.max_size = min(
+            config.archive_max_size() * 1024**2,
+            config.archive_max_ratio() * max(os.path.getsize(path), 1),
+        )
+        self.members = 0
+        self.size = 0
+
+    def add_member(self) -> bool:
+        if self.members >= self.max_members:
+            log.warning(
+                "Archive %s has more than %d files. The rest is ignored",
+                self.path,
+                self.max_members,
+            )
+            return False
+        self.members += 1
+        return True
+
+    def check(self, size: int):
+        if self.size + size > self.max_size:
+            raise exc.ArchiveLimitError(
+                self.path,
+                f"decompressed content exceeds {self.max_size} bytes",
+            )
+
+    def consume(self, size: int):
+        self.check(size)
+        self.size += size
+
+
+def extract_archive(path: str) -> Iterator[Member]:
+    """Extract indexable data from every supported file inside archive.
+
+    Members are decompressed one at a time into a temporary file. Member is
+    produced while its file exists and its chunks are extracted lazily, so
+    it must be merged before the next member is requested: at this moment
+    the file is removed.
+    """
+    limits = Limits(path)
+    detected = sniff.sniff(path)
+
+    if detected.mimetype == "application/zip":
+        members = _zip_members(path, limits)
+    elif detected.mimetype.startswith(sniff.GZIP):
+        members = _gzip_members(path, limits)
+    elif detected.mimetype == "application/x-tar":
+        members = _tar_members(path, "r|", limits)
+    else:
+        raise exc.UnexpectedContentError(path)
+
+    for name, stream in members:
+        yield from _extract_member(name, stream, limits)
+
+
+def merge_archive(pkg_dict: dict[str, Any], members: Iterable[Member]):
+    """Merge members one by one, as soon as they are extracted.
+
+    When limits are exceeded, members merged before the error remain in
+    the package.
+    """
+    for member in members:
+        token = utils.current_resource.set(member.resource)
+        try:
+            member.handler.merge_chunks_into_index(pkg_dict, member.chunks)
+        finally:
+            utils.current_resource.reset(token)
+
+
+def _zip_members(
+    path: str, limits: Limits
+) -> Iterable[tuple[str, Optional[IO[bytes]]]]:
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+
+            if not limits.add_member():
+                return
+
+            # fail early, before decompressing anything
+            limits.check(info.file_size)
+            if _format_of(info.filename) is None:
+                yield info.filename, None
+                continue
+
+            with archive.open(info) as stream:
+                yield info.filename, stream
+
+
+def _tar_members(
+    path: str, mode: str, limits: Limits
+) -> Iterable[tuple[str, Optional[IO[bytes]]]]:
+    # stream mode reads archive sequentially and never seeks
+    with tarfile.open(path, mode) as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+
+            if not limits.add_member():
+                return
+
+            limits.check(info.size)
+            if _format_of(info.name) is None:
+                yield info.name, None
+                continue
+
+            yield info.name, archive.extractfile(info)
+
+
+def _gzip_members(
+    path: str, limits: Limits
+) -> Iterable[tuple[str, Optional[IO[bytes]]]]:
+    import gzip
+
+    found = False
+    try:
+        for member in _tar_members(path, "r|gz", limits):
+            found = True
+            yield member
+        return
+    except tarfile.ReadError:
+        if found:
+            raise
+
+    # compressed file, not an archive
+    if limits.add_member():
+        with gzip.open(path) as stream:
+            yield "", stream
+
+
+def _format_of(name: str) -> Optional[str]:
+    """Format of the member based on its name.
+
+    Returns:
+        format, if it's indexable; empty string, if name has no extension;
+        None if member must be skipped.
+    """
+    basename = os.path.basename(name)
+    if basename.startswith("."):
+        return None
+
+    _root, ext = os.path.splitext(basename)
+    if not ext:
+        return ""
+
+    fmt = ext[1:].lower()
+    if fmt in ARCHIVE_FORMATS or fmt not in config.indexable_formats():
+        return None
+
+    return fmt
+
+
+def _extract_member(
+    name: str, stream: Optional[IO[bytes]], limits: Limits
+) -> Iterator[Member]:
+    if stream is None:
+        log.debug("Skip member %s of archive %s", name, limits.path)
+        return
+
+    parent = utils.current_resource.get() or {"id": limits.path}
+    dest = tempfile.NamedTemporaryFile(delete=False)
+    with utils.RemovablePath(dest.name) as tmp:
+        with dest:
+            _copy(stream, dest, limits)
+
+        with utils.ResourceFile(tmp) as file:
+            member = _extract_file(name, file, parent)
+            if member:
+                yield member
+
+
+def _extract_file(
+    name: str, file: utils.ResourceFile, parent: dict[str, Any]
+) -> Optional[Member]:
+    fmt = _format_of(name) or file.sniff().format
+    if (
+        not fmt
+        or fmt in ARCHIVE_FORMATS
+        or fmt not in config.indexable_formats()
+    ):
+        return None
+
+    res = dict(parent, format=fmt, name=name)
+    routed = utils.route_by_content(res, file)
+    if not routed:
+        return None
+
+    handler = utils.get_handler(routed)
+    if not handler:
+        return None
+
+    return Member(routed, handler, utils.extract_chunks(handler, file))
+
+
+def _copy(stream: IO[bytes], dest: IO[bytes], limits: Limits):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        limits.consume(len(chunk))
+        dest.write(chunk)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+from typing import Iterable, NamedTuple
+
+TARGET = "ckanext.resource_indexer.plugin"
+
+# modules that are loaded by CKAN itself, before any plugin
+BASELINE = ("ckan.plugins", "ckan.plugins.toolkit", "ckan.lib.search.query")
+
+# optional dependencies and modules that must be loaded only on first use
+HEAVY_MODULES = (
+    "magic",
+    "pdftotext",
+    "requests",
+    "redis",
+    "sqlalchemy",
+    "sqlite3",
+    "click",
+    "tarfile",
+    "zipfile",
+    "multiprocessing",
+    "concurrent.futures",
+    "ckan.lib.uploader",
+    "ckanext.resource_indexer.archive",
+    "ckanext.resource_indexer.cli",
+    "ckanext.resource_indexer.markup",
+    "ckanext.resource_indexer.ocr",
+    "ckanext.resource_indexer.work_queue",
+)
+
+_PROBE = """
+import json, sys, time
+
+def rss():
+    try:
+        with open("/proc/self/status") as src:
+            for line in src:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+for name in {baseline!r}:
+    __import__(name)
+
+modules = set(sys.modules)
+memory = rss()
+start = time.perf_counter()
+__import__({target!r})
+duration = time.perf_counter() - start
+
+print(json.dumps({{
+    "duration": duration,
+    "rss": rss() - memory,
+    "modules": sorted(set(sys.modules) - modules),
+}}))
+"""
+
+
+class ImportProfile(NamedTuple):
+    """Cost of importing the module on top of the baseline."""
+
+    # seconds
+    duration: float
+    # kilobytes
+    rss: int
+    # modules loaded because of the import
+    modules: list[str]
+
+    @property
+    def heavy(self) -> list[str]:
+        return [
+            name
+            for name in self.modules
+            if any(
+                name == heavy or name.startswith(heavy + ".")
+                for heavy in HEAVY_MODULES
+            )
+        ]
+
+
+def profile_import(
+    target: str = TARGET, baseline: Iterable[str] = BASELINE
+) -> ImportProfile:
+    """Measure import of the module inside a fresh interpreter."""
+    probe = _PROBE.format(baseline=tuple(baseline), target=target)
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return ImportProfile(data["duration"], data["rss"], data["modules"])
+
+
+def summarize(profiles: list[ImportProfile]) -> ImportProfile:
+    """Median duration and memory of multiple runs."""
+    return ImportProfile(
+        statistics.median(p.duration for p in profiles),
+        int(statistics.median(p.rss for p in profiles)),
+        sorted({name for p in profiles for name in p.modules}),
+    )
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import os
 import re
+import socket
+import time
 import contextlib
 import logging
+from collections.abc import Collection
 from typing import Any, Optional
 
 import click
@@ -11,7 +15,7 @@ from ckan import model
 import ckan.plugins.toolkit as tk
 from ckan.lib.search import index_for, common
 
-from . import config, utils
+from . import config, exc, hosts, schedule, utils
 
 log = logging.getLogger(__name__)
 
@@ -43,77 +47,427 @@ def resource_indexer():
     pass
 
 
+def _formats(
+    include_format: tuple[str, ...], exclude_format: tuple[str, ...]
+) -> list[str]:
+    formats = {
+        *config.indexable_formats(),
+        *{f.lower() for f in include_format},
+    }
+
+    for f in exclude_format:
+        formats.remove(f.lower())
+
+    return list(formats)
+
+
+def _package_ids() -> list[str]:
+    return [
+        r[0]
+        for r in model.Session.query(model.Package.id).filter(
+            model.Package.state != "deleted"
+        )
+    ]
+
+
+class _Indexer:
+    """Index packages one by one, explaining failures."""
+
+    def __init__(self):
+        from . import metrics
+
+        self.package_index = index_for(model.Package)
+        self.context = {
+            "model": model,
+            "ignore_auth": True,
+            "validate": False,
+            "use_cache": False,
+        }
+        self.metrics = metrics.get_store()
+
+    def __call__(self, id_: str) -> bool:
+        start = time.perf_counter()
+        pkg_dict = tk.get_action("package_show")(
+            dict(self.context), {"id": id_}
+        )
+        # CLI has no latency constraints, so the time budget is ignored
+        with utils.unlimited_indexation(), utils.capture_content() as capture:
+            try:
+                log.info("Index package %s", id_)
+                self.package_index.insert_dict(pkg_dict)
+            except common.SearchIndexError as e:
+                log.error(
+                    "Cannot index the package %s because of error: %s",
+                    id_,
+                    e,
+                )
+                if not _suggest_solution(e, pkg_dict, capture):
+                    log.exception("Cannot suggest solution for the problem.")
+
+                return False
+
+        if self.metrics:
+            self.metrics.record_package(id_, time.perf_counter() - start)
+        return True
+
+
 @resource_indexer.command()
 @click.argument("ids", nargs=-1)
 @click.option("-f", "--include-format", multiple=True)
 @click.option("-F", "--exclude-format", multiple=True)
+@click.option(
+    "--enqueue",
+    is_flag=True,
+    help="Add packages to the shared queue instead of indexing them",
+)
+@click.option(
+    "-o",
+    "--order",
+    type=click.Choice([o.value for o in schedule.Order]),
+    default=schedule.Order.none.value,
+    help="Order of packages, based on the estimated cost of indexation",
+)
+@click.option(
+    "--defer-above",
+    type=float,
+    help="Index packages with estimated cost(seconds) above this value"
+    " after all other packages",
+)
+@click.option(
+    "--workers",
+    default=1,
+    help="Split packages between this number of independent rebuilds",
+)
+@click.option(
+    "--worker-index",
+    default=0,
+    help="0-based index of the current rebuild, when --workers is used",
+)
 def rebuild(
     ids: Collection[str],
     include_format: tuple[str],
     exclude_format: tuple[str],
+    enqueue: bool,
+    order: str,
+    defer_above: Optional[float],
+    workers: int,
+    worker_index: int,
 ):
-    formats = {
-        *config.indexable_formats(),
-        *{f.lower() for f in include_format},
-    }
+    """Index packages with resource content.
 
-    for f in exclude_format:
-        formats.remove(f.lower())
+    With `--enqueue` flag packages are only added to the shared queue. Use
+    `worker` command on any number of nodes to process the queue.
+
+    With `--workers N` packages are split between N rebuilds by the hash
+    of package ID and only the part with `--worker-index` is indexed. Run
+    the command N times with different indexes in parallel.
+    """
+    if not 0 <= worker_index < workers:
+        raise click.BadParameter(
+            "must be between 0 and --workers", param_hint="--worker-index"
+        )
+
+    if enqueue and (include_format or exclude_format):
+        # queue contains only package IDs, formats are decided by workers
+        raise click.UsageError(
+            "-f/-F cannot be combined with --enqueue. Pass them to the"
+            " `worker` command instead"
+        )
+
+    formats = _formats(include_format, exclude_format)
 
     if not ids:
-        ids = [
-            r[0]
-            for r in model.Session.query(model.Package.id).filter(
-                model.Package.state != "deleted"
-            )
-        ]
-
-    package_index = index_for(model.Package)
-    context = {
-        "model": model,
-        "ignore_auth": True,
-        "validate": False,
-        "use_cache": False,
-    }
+        ids = _package_ids()
+    ids = list(ids)
+
+    if workers > 1:
+        ids = schedule.partition(ids, workers)[worker_index]
+
+    how = schedule.Order(order)
+    deferred: list[str] = []
+    if how != schedule.Order.none or defer_above is not None:
+        with _patched_config(config.CONFIG_INDEXABLE_FORMATS, formats):
+            costs = schedule.estimate_packages(ids)
 
-    with _patched_config(config.CONFIG_INDEXABLE_FORMATS, list(formats)):
+        ids = schedule.order(ids, costs, how)
+        ids, deferred = schedule.split_expensive(ids, costs, defer_above)
+
+    if enqueue:
+        from . import work_queue
+
+        shared = work_queue.get_queue()
+        count = shared.enqueue(ids)
+        if deferred:
+            count += shared.enqueue(deferred, priority=-1)
+        click.secho(f"{count} packages added to the queue", fg="green")
+        return
+
+    index = _Indexer()
+    with _patched_config(config.CONFIG_INDEXABLE_FORMATS, formats):
         with click.progressbar(ids) as bar:
             for id_ in bar:
-                pkg_dict = tk.get_action("package_show")(
-                    dict(context), {"id": id_}
-                )
+                index(id_)
+
+        if deferred:
+            click.secho(f"Index {len(deferred)} deferred packages")
+            with click.progressbar(deferred) as bar:
+                for id_ in bar:
+                    index(id_)
+
+    _report_skipped_hosts()
+
+
+@resource_indexer.command()
+@click.option("-f", "--include-format", multiple=True)
+@click.option("-F", "--exclude-format", multiple=True)
+@click.option(
+    "-n", "--name", help="Unique name of the worker(default: host:pid)"
+)
+@click.option("-b", "--batch-size", default=10, help="Packages per claim")
+@click.option(
+    "-l",
+    "--lease",
+    default=600,
+    help="Seconds after which packages claimed by dead worker are released",
+)
+@click.option(
+    "--idle-delay", default=5.0, help="Seconds to wait when queue is empty"
+)
+@click.option("--burst", is_flag=True, help="Exit when queue is empty")
+def worker(
+    include_format: tuple[str],
+    exclude_format: tuple[str],
+    name: Optional[str],
+    batch_size: int,
+    lease: int,
+    idle_delay: float,
+    burst: bool,
+):
+    """Index packages from the shared queue.
+
+    Any number of workers can run on different nodes. Every worker claims
+    packages in batches, indexes and acknowledges them. Batch must be
+    processed before lease expires, otherwise it's returned to the queue.
+    """
+    from . import work_queue
+
+    formats = _formats(include_format, exclude_format)
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    shared = work_queue.get_queue()
+    index = _Indexer()
+    processed = 0
+
+    with _patched_config(config.CONFIG_INDEXABLE_FORMATS, formats):
+        while True:
+            ids = shared.claim(name, batch_size, lease)
+            if not ids:
+                if burst:
+                    break
+                time.sleep(idle_delay)
+                continue
+
+            for id_ in ids:
                 try:
-                    log.info("Index package %s", id_)
-                    package_index.insert_dict(pkg_dict)
-                except common.SearchIndexError as e:
-                    log.error(
-                        "Cannot index the package %s because of error: %s",
-                        id_,
-                        e,
-                    )
-                    if not _suggest_solution(e, pkg_dict):
-                        log.exception(
-                            "Cannot suggest solution for the problem."
-                        )
-
-                    continue
+                    index(id_)
+                except Exception:
+                    log.exception("Cannot index the package %s", id_)
+
+                # failed packages are acknowledged as well, otherwise they
+                # are processed again and again
+                shared.ack(name, [id_])
+                processed += 1
+
+    click.secho(f"Worker {name} processed {processed} packages", fg="green")
+    _report_skipped_hosts()
+
+
+@resource_indexer.group()
+def queue():
+    """Manage the shared queue used by workers."""
+
+
+@queue.command()
+def init():
+    """Create the queue table in the database from `queue.url`.
+
+    Table inside CKAN's database is created by `ckan db upgrade -p
+    resource_indexer` instead.
+    """
+    from . import work_queue
+
+    shared = work_queue.get_queue()
+    if not isinstance(shared, work_queue.SqlQueue):
+        click.secho("Queue does not require initialization", fg="green")
+        return
+
+    shared.create_table()
+    click.secho("Queue table is ready", fg="green")
+
+
+@queue.command()
+def status():
+    """Show the number of packages in the queue."""
+    from . import work_queue
+
+    for key, value in work_queue.get_queue().stats().items():
+        click.echo(f"{key}: {value}")
+
+
+@queue.command()
+def clear():
+    """Remove all packages from the queue."""
+    from . import work_queue
+
+    work_queue.get_queue().clear()
+    click.secho("Queue is empty", fg="green")
+
+
+@resource_indexer.command()
+@click.argument("ids", nargs=-1, required=True)
+def update(ids: tuple[str, ...]):
+    """Update content of resources without reindexing their packages.
+
+    Requires `field` content mode. Content is extracted again, even if
+    it's cached, and sent to Solr as an atomic update of the resource's
+    field.
+    """
+    for id_ in ids:
+        res = tk.get_action("resource_show")(
+            {"ignore_auth": True}, {"id": id_}
+        )
+        try:
+            text = utils.update_resource_field(res, force=True)
+        except exc.ResourceIndexerError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{id_}: {len(text)} characters indexed")
+
+
+@resource_indexer.command()
+@click.option(
+    "-p",
+    "--problems",
+    is_flag=True,
+    help="List resources that produced nothing, garbage or errors",
+)
+@click.option(
+    "--min-printable",
+    default=0.9,
+    help="Resources with smaller ratio of printable characters are garbage",
+)
+@click.option("-l", "--limit", default=50, help="Max number of resources")
+def stats(problems: bool, min_printable: float, limit: int):
+    """Show outcomes of content extraction.
+
+    Statistics are collected when `ckanext.resource_indexer.stats.enabled`
+    is set.
+    """
+    from . import metrics
+
+    store = metrics.get_store()
+    if not store:
+        raise click.ClickException(
+            f"{config.CONFIG_METRICS_PATH} is not configured"
+        )
+
+    if problems:
+        for row in store.stats_problems(min_printable, limit):
+            if row["error"]:
+                outcome = row["error"]
+            elif not row["chars"]:
+                outcome = "empty"
+            else:
+                outcome = f"printable {row['printable_ratio']:.0%}"
+            click.echo(
+                f"{row['resource_id']} {row['format']} {row['handler']}"
+                f" {row['duration']:.2f}s: {outcome}"
+            )
+        return
+
+    for row in store.stats_summary():
+        ratio = row["printable_ratio"]
+        click.echo(
+            f"{row['handler']}({row['format'] or 'unknown format'}):"
+            f" {row['resources']} resources, {row['empty']} empty,"
+            f" {row['errors']} errors, {row['chars']} characters,"
+            f" {'-' if ratio is None else f'{ratio:.0%}'} printable,"
+            f" {row['duration']:.1f}s"
+        )
+
+
+@resource_indexer.group()
+def cache():
+    """Manage content extracted from resources."""
+
+
+@cache.command("clear")
+def clear_cache():
+    """Remove cached content of all resources."""
+    from . import metrics
+
+    store = metrics.get_store()
+    if not store:
+        raise click.ClickException(
+            f"{config.CONFIG_METRICS_PATH} is not configured"
+        )
+
+    count = store.clear_content()
+    click.secho(f"{count} cached resources removed", fg="green")
+
+
+@resource_indexer.command()
+@click.option("-n", "--repeat", default=5, help="Number of measurements")
+def profile_import(repeat: int):
+    """Measure startup cost of the extension.
+
+    Plugin module is imported inside a fresh interpreter, after CKAN core.
+    Reports median import time, growth of resident memory and optional
+    dependencies that were loaded eagerly.
+    """
+    from . import benchmark
+
+    profile = benchmark.summarize(
+        [benchmark.profile_import() for _ in range(repeat)]
+    )
+    click.echo(f"Import time: {profile.duration * 1000:.1f}ms")
+    click.echo(f"RSS growth: {profile.rss}KB")
+    click.echo(f"Loaded modules: {len(profile.modules)}")
+
+    if profile.heavy:
+        click.secho(
+            "Heavy modules loaded on import: " + ", ".join(profile.heavy),
+            fg="red",
+        )
+    else:
+        click.secho("No heavy modules loaded on import", fg="green")
+
+
+def _report_skipped_hosts():
+    skipped = hosts.get_registry().report()
+    if not skipped:
+        return
+
+    click.secho("Requests to the following hosts were skipped:", fg="yellow")
+    for host, count in sorted(skipped.items(), key=lambda p: -p[1]):
+        click.echo(f"\t{host}: {count}")
 
 
 def _suggest_solution(
-    err: common.SearchIndexError, pkg_dict: dict[str, Any]
+    err: common.SearchIndexError,
+    pkg_dict: dict[str, Any],
+    capture: utils.ContentCapture,
 ) -> bool:
     match = RE_WRONG_OFFSET.search(str(err))
-    value = utils.debug_last_content.get()
-    if value and match:
+    if capture.fragments and match:
         start = int(match.group("start"))
         end = int(match.group("end"))
+        res_id = capture.resource_at(start)
 
         # let's add a bit of context
         start = max(0, start - 10)
         end = end + 10
         log.info(
             (
-                "The following fragment came from one of the resources"
+                "The following fragment came from the resource %s"
                 " attached to the package with ID %s and cannot be indexed:"
                 " '%s'. Usually, this error is caused by an unsuitable"
                 " configuration for the Solr field, which holds indexed"
@@ -121,8 +475,9 @@ def _suggest_solution(
                 " human-readable text, while file contents consist of"
                 " abbreviations, measurement units and numbers."
             ),
+            res_id or "<unknown>",
             pkg_dict["id"],
-            value[start:end],
+            capture.window(start, end),
         )
         return True
 
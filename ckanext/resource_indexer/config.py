@@ -1,8 +1,12 @@
 from __future__ import annotations
 from collections.abc import Collection, Container
 
+import enum
 import logging
-from typing import Any, Callable
+import os
+import shlex
+import tempfile
+from typing import Any, Callable, Optional
 
 from werkzeug.utils import import_string
 
@@ -10,6 +14,17 @@ import ckan.plugins.toolkit as tk
 
 log = logging.getLogger(__name__)
 
+
+class ContentMode(str, enum.Enum):
+    """Where the content of resources is stored in the search index."""
+
+    # all resources share `index_field` of the package document
+    package = "package"
+    # every resource has own dynamic field in the package document
+    field = "field"
+    # every resource is stored as a nested child document of the package
+    child = "child"
+
 CONFIG_JSON_AS_TEXT = "ckanext.resoruce_indexer.json.add_as_plain"
 DEFAULT_JSON_AS_TEXT = False
 
@@ -25,15 +40,89 @@ DEFAULT_ALLOW_REMOTE = False
 CONFIG_REMOTE_TIMEOUT = "ckanext.resource_indexer.remote_timeout"
 DEFAULT_REMOTE_TIMEOUT = 2
 
+CONFIG_HOST_FAILURE_THRESHOLD = (
+    "ckanext.resource_indexer.remote.failure_threshold"
+)
+DEFAULT_HOST_FAILURE_THRESHOLD = 3
+
+CONFIG_HOST_COOLDOWN = "ckanext.resource_indexer.remote.cooldown"
+DEFAULT_HOST_COOLDOWN = 60
+
+CONFIG_HOST_CONCURRENCY = "ckanext.resource_indexer.remote.host_concurrency"
+DEFAULT_HOST_CONCURRENCY = 4
+
+CONFIG_HOST_INTERVAL = "ckanext.resource_indexer.remote.host_interval"
+DEFAULT_HOST_INTERVAL = 0
+
 CONFIG_INDEXABLE_FORMATS = "ckanext.resource_indexer.indexable_formats"
 DEFAULT_INDEXABLE_FORMATS = None
 
 CONFIG_PLAIN_FORMATS = "ckanext.resource_indexer.plain.indexable_formats"
 DEFAULT_PLAIN_FORMATS = ["txt", "csv", "json", "yaml", "yml", "html"]
 
+CONFIG_SNIFF_CONTENT = "ckanext.resource_indexer.sniff_content"
+DEFAULT_SNIFF_CONTENT = True
+
+CONFIG_MMAP_UPLOADS = "ckanext.resource_indexer.mmap_uploads"
+DEFAULT_MMAP_UPLOADS = False
+
 CONFIG_BOOST = "ckanext.resoruce_indexer.search_boost"
 DEFAULT_BOOST = 1.0
 
+CONFIG_FORMAT_FIELD_PREFIX = "ckanext.resource_indexer.format_field_prefix"
+DEFAULT_FORMAT_FIELD_PREFIX = None
+
+CONFIG_FORMAT_BOOST = "ckanext.resource_indexer.format_boost"
+DEFAULT_FORMAT_BOOST = None
+
+CONFIG_CONTENT_MODE = "ckanext.resource_indexer.content_mode"
+DEFAULT_CONTENT_MODE = "package"
+
+CONFIG_RESOURCE_FIELD_PREFIX = "ckanext.resource_indexer.resource_field_prefix"
+DEFAULT_RESOURCE_FIELD_PREFIX = "extras_res_content_"
+
+CONFIG_QUEUE_URL = "ckanext.resource_indexer.queue.url"
+DEFAULT_QUEUE_URL = None
+
+CONFIG_ARCHIVE_MAX_MEMBERS = "ckanext.resource_indexer.archive.max_members"
+DEFAULT_ARCHIVE_MAX_MEMBERS = 100
+
+CONFIG_ARCHIVE_MAX_SIZE = "ckanext.resource_indexer.archive.max_size"
+DEFAULT_ARCHIVE_MAX_SIZE = 100
+
+CONFIG_ARCHIVE_MAX_RATIO = "ckanext.resource_indexer.archive.max_ratio"
+DEFAULT_ARCHIVE_MAX_RATIO = 100
+
+CONFIG_METRICS_PATH = "ckanext.resource_indexer.metrics_path"
+DEFAULT_METRICS_PATH = None
+
+CONFIG_CACHE_CONTENT = "ckanext.resource_indexer.cache_content"
+DEFAULT_CACHE_CONTENT = False
+
+CONFIG_ATOMIC_UPDATES = "ckanext.resource_indexer.atomic_updates"
+DEFAULT_ATOMIC_UPDATES = False
+
+CONFIG_INDEX_TIME_BUDGET = "ckanext.resource_indexer.index_time_budget"
+DEFAULT_INDEX_TIME_BUDGET = 0
+
+CONFIG_COLLECT_STATS = "ckanext.resource_indexer.stats.enabled"
+DEFAULT_COLLECT_STATS = False
+
+CONFIG_STATS_SKIP_EMPTY = "ckanext.resource_indexer.stats.skip_empty"
+DEFAULT_STATS_SKIP_EMPTY = False
+
+CONFIG_STATS_REROUTE_EMPTY = "ckanext.resource_indexer.stats.reroute_empty"
+DEFAULT_STATS_REROUTE_EMPTY = False
+
+CONFIG_FORMAT_COST = "ckanext.resource_indexer.format_cost"
+DEFAULT_FORMAT_COST = "pdf:1 zip:0.5 tar:0.5 gz:0.5 *:0.1"
+
+CONFIG_MARKUP_ATTRIBUTES = "ckanext.resource_indexer.markup.attributes"
+DEFAULT_MARKUP_ATTRIBUTES = ["alt", "title"]
+
+CONFIG_MARKUP_SKIP_TAGS = "ckanext.resource_indexer.markup.skip_tags"
+DEFAULT_MARKUP_SKIP_TAGS = ["script", "style", "noscript", "template"]
+
 CONFIG_JSON_KEY = "ckanext.resoruce_indexer.json.key_processor"
 DEFAULT_JSON_KEY = "builtins:str"
 
@@ -43,6 +132,35 @@ DEFAULT_JSON_VALUE = "builtins:str"
 CONFIG_PFD_PROCESSOR = "ckanext.resoruce_indexer.pdf.page_processor"
 DEFAULT_PFD_PROCESSOR = "builtins:str"
 
+CONFIG_OCR_MIN_CHARS = "ckanext.resource_indexer.ocr.min_chars"
+DEFAULT_OCR_MIN_CHARS = 20
+
+CONFIG_OCR_PAGE_BUDGET = "ckanext.resource_indexer.ocr.page_budget"
+DEFAULT_OCR_PAGE_BUDGET = 50
+
+CONFIG_OCR_WORKERS = "ckanext.resource_indexer.ocr.workers"
+DEFAULT_OCR_WORKERS = 2
+
+CONFIG_OCR_LANGUAGE = "ckanext.resource_indexer.ocr.language"
+DEFAULT_OCR_LANGUAGE = "eng"
+
+CONFIG_OCR_DPI = "ckanext.resource_indexer.ocr.dpi"
+DEFAULT_OCR_DPI = 300
+
+CONFIG_OCR_TIMEOUT = "ckanext.resource_indexer.ocr.timeout"
+DEFAULT_OCR_TIMEOUT = 60
+
+CONFIG_OCR_TESSERACT = "ckanext.resource_indexer.ocr.tesseract_command"
+DEFAULT_OCR_TESSERACT = "tesseract"
+
+CONFIG_OCR_PDFTOPPM = "ckanext.resource_indexer.ocr.pdftoppm_command"
+DEFAULT_OCR_PDFTOPPM = "pdftoppm"
+
+CONFIG_OCR_CACHE_DIR = "ckanext.resource_indexer.ocr.cache_dir"
+DEFAULT_OCR_CACHE_DIR = os.path.join(
+    tempfile.gettempdir(), "ckanext-resource-indexer-ocr"
+)
+
 
 def index_json_as_text() -> bool:
     return tk.asbool(tk.config.get(CONFIG_JSON_AS_TEXT, DEFAULT_JSON_AS_TEXT))
@@ -67,6 +185,16 @@ def plain_formats() -> Container[str]:
     )
 
 
+def sniff_content() -> bool:
+    return tk.asbool(
+        tk.config.get(CONFIG_SNIFF_CONTENT, DEFAULT_SNIFF_CONTENT)
+    )
+
+
+def mmap_uploads() -> bool:
+    return tk.asbool(tk.config.get(CONFIG_MMAP_UPLOADS, DEFAULT_MMAP_UPLOADS))
+
+
 def allow_remote() -> bool:
     return tk.asbool(tk.config.get(CONFIG_ALLOW_REMOTE, DEFAULT_ALLOW_REMOTE))
 
@@ -83,6 +211,28 @@ def remote_timeout() -> int:
     )
 
 
+def host_failure_threshold() -> int:
+    return tk.asint(
+        tk.config.get(
+            CONFIG_HOST_FAILURE_THRESHOLD, DEFAULT_HOST_FAILURE_THRESHOLD
+        )
+    )
+
+
+def host_cooldown() -> float:
+    return float(tk.config.get(CONFIG_HOST_COOLDOWN, DEFAULT_HOST_COOLDOWN))
+
+
+def host_concurrency() -> int:
+    return tk.asint(
+        tk.config.get(CONFIG_HOST_CONCURRENCY, DEFAULT_HOST_CONCURRENCY)
+    )
+
+
+def host_interval() -> float:
+    return float(tk.config.get(CONFIG_HOST_INTERVAL, DEFAULT_HOST_INTERVAL))
+
+
 def index_field() -> str:
     return tk.config.get(CONFIG_INDEX_FIELD, DEFAULT_INDEX_FIELD)
 
@@ -107,3 +257,180 @@ def boost() -> float:
     except (TypeError, ValueError) as e:
         log.error("Cannot parse %s: %s", CONFIG_BOOST, e)
         return DEFAULT_BOOST
+
+
+def format_field_prefix() -> Optional[str]:
+    return tk.config.get(
+        CONFIG_FORMAT_FIELD_PREFIX, DEFAULT_FORMAT_FIELD_PREFIX
+    )
+
+
+def format_boost() -> dict[str, float]:
+    boosts = {}
+    for item in tk.aslist(
+        tk.config.get(CONFIG_FORMAT_BOOST, DEFAULT_FORMAT_BOOST)
+    ):
+        fmt, _sep, value = item.rpartition(":")
+        try:
+            if not fmt:
+                raise ValueError("format is missing")
+            boosts[fmt.lower()] = float(value)
+        except ValueError as e:
+            log.error(
+                "Cannot parse %s item %s: %s", CONFIG_FORMAT_BOOST, item, e
+            )
+    return boosts
+
+
+def content_mode() -> ContentMode:
+    value = tk.config.get(CONFIG_CONTENT_MODE, DEFAULT_CONTENT_MODE)
+    try:
+        return ContentMode(value)
+    except ValueError:
+        log.error("Unsupported %s: %s", CONFIG_CONTENT_MODE, value)
+        return ContentMode(DEFAULT_CONTENT_MODE)
+
+
+def resource_field_prefix() -> str:
+    return tk.config.get(
+        CONFIG_RESOURCE_FIELD_PREFIX, DEFAULT_RESOURCE_FIELD_PREFIX
+    )
+
+
+def queue_url() -> Optional[str]:
+    return tk.config.get(CONFIG_QUEUE_URL, DEFAULT_QUEUE_URL)
+
+
+def archive_max_members() -> int:
+    return tk.asint(
+        tk.config.get(CONFIG_ARCHIVE_MAX_MEMBERS, DEFAULT_ARCHIVE_MAX_MEMBERS)
+    )
+
+
+def archive_max_size() -> int:
+    return tk.asint(
+        tk.config.get(CONFIG_ARCHIVE_MAX_SIZE, DEFAULT_ARCHIVE_MAX_SIZE)
+    )
+
+
+def archive_max_ratio() -> int:
+    return tk.asint(
+        tk.config.get(CONFIG_ARCHIVE_MAX_RATIO, DEFAULT_ARCHIVE_MAX_RATIO)
+    )
+
+
+def metrics_path() -> Optional[str]:
+    return tk.config.get(CONFIG_METRICS_PATH, DEFAULT_METRICS_PATH) or None
+
+
+def cache_content() -> bool:
+    return tk.asbool(
+        tk.config.get(CONFIG_CACHE_CONTENT, DEFAULT_CACHE_CONTENT)
+    )
+
+
+def atomic_updates() -> bool:
+    return tk.asbool(
+        tk.config.get(CONFIG_ATOMIC_UPDATES, DEFAULT_ATOMIC_UPDATES)
+    )
+
+
+def index_time_budget() -> float:
+    return float(
+        tk.config.get(CONFIG_INDEX_TIME_BUDGET, DEFAULT_INDEX_TIME_BUDGET)
+    )
+
+
+def collect_stats() -> bool:
+    return tk.asbool(
+        tk.config.get(CONFIG_COLLECT_STATS, DEFAULT_COLLECT_STATS)
+    )
+
+
+def stats_skip_empty() -> bool:
+    return tk.asbool(
+        tk.config.get(CONFIG_STATS_SKIP_EMPTY, DEFAULT_STATS_SKIP_EMPTY)
+    )
+
+
+def stats_reroute_empty() -> bool:
+    return tk.asbool(
+        tk.config.get(CONFIG_STATS_REROUTE_EMPTY, DEFAULT_STATS_REROUTE_EMPTY)
+    )
+
+
+def format_cost() -> dict[str, float]:
+    costs = {}
+    for item in tk.aslist(
+        tk.config.get(CONFIG_FORMAT_COST, DEFAULT_FORMAT_COST)
+    ):
+        fmt, _sep, value = item.rpartition(":")
+        try:
+            if not fmt:
+                raise ValueError("format is missing")
+            costs[fmt.lower()] = float(value)
+        except ValueError as e:
+            log.error(
+                "Cannot parse %s item %s: %s", CONFIG_FORMAT_COST, item, e
+            )
+    return costs
+
+
+def markup_attributes() -> list[str]:
+    return [
+        attr.lower()
+        for attr in tk.aslist(
+            tk.config.get(CONFIG_MARKUP_ATTRIBUTES, DEFAULT_MARKUP_ATTRIBUTES)
+        )
+    ]
+
+
+def markup_skip_tags() -> list[str]:
+    return [
+        tag.lower()
+        for tag in tk.aslist(
+            tk.config.get(CONFIG_MARKUP_SKIP_TAGS, DEFAULT_MARKUP_SKIP_TAGS)
+        )
+    ]
+
+
+def ocr_min_chars() -> int:
+    return tk.asint(tk.config.get(CONFIG_OCR_MIN_CHARS, DEFAULT_OCR_MIN_CHARS))
+
+
+def ocr_page_budget() -> int:
+    return tk.asint(
+        tk.config.get(CONFIG_OCR_PAGE_BUDGET, DEFAULT_OCR_PAGE_BUDGET)
+    )
+
+
+def ocr_workers() -> int:
+    return tk.asint(tk.config.get(CONFIG_OCR_WORKERS, DEFAULT_OCR_WORKERS))
+
+
+def ocr_language() -> str:
+    return tk.config.get(CONFIG_OCR_LANGUAGE, DEFAULT_OCR_LANGUAGE)
+
+
+def ocr_dpi() -> int:
+    return tk.asint(tk.config.get(CONFIG_OCR_DPI, DEFAULT_OCR_DPI))
+
+
+def ocr_timeout() -> int:
+    return tk.asint(tk.config.get(CONFIG_OCR_TIMEOUT, DEFAULT_OCR_TIMEOUT))
+
+
+def ocr_tesseract_command() -> list[str]:
+    return shlex.split(
+        tk.config.get(CONFIG_OCR_TESSERACT, DEFAULT_OCR_TESSERACT)
+    )
+
+
+def ocr_pdftoppm_command() -> list[str]:
+    return shlex.split(
+        tk.config.get(CONFIG_OCR_PDFTOPPM, DEFAULT_OCR_PDFTOPPM)
+    )
+
+
+def ocr_cache_dir() -> Optional[str]:
+    return tk.config.get(CONFIG_OCR_CACHE_DIR, DEFAULT_OCR_CACHE_DIR) or None
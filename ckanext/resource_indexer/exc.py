@@ -1,12 +1,19 @@
 from __future__ import annotations
 
-import magic
-
 
 class ResourceIndexerError(Exception):
     pass
 
 
+class HostUnavailableError(ResourceIndexerError):
+    def __init__(self, host: str, reason: str):
+        self.host = host
+        self.reason = reason
+
+    def __str__(self):
+        return f"Host {self.host} is skipped: {self.reason}"
+
+
 class FileError(ResourceIndexerError):
     def __init__(self, filepath: str):
         self.filepath = filepath
@@ -36,9 +43,11 @@ class UnexpectedContentError(FileError):
     def __init__(self, filepath: str):
         super().__init__(filepath)
 
-        with open(filepath, "rb") as source:
-            self.chunk = source.read(1024)
-            self.mimetype = magic.from_buffer(self.chunk, True)
+        from .sniff import sniff
+
+        detected = sniff(filepath)
+        self.chunk = detected.head[:1024]
+        self.mimetype = detected.mimetype
 
     def __str__(self):
         return (
@@ -46,3 +55,12 @@ class UnexpectedContentError(FileError):
             f" Mimetype: {self.mimetype}. First 100 bytes of content:"
             f" {self.chunk[:100]}"
         )
+
+
+class ArchiveLimitError(FileError):
+    def __init__(self, filepath: str, reason: str):
+        super().__init__(filepath)
+        self.reason = reason
+
+    def __str__(self):
+        return f"Archive {self.filepath} cannot be processed: {self.reason}"
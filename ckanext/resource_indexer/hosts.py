@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from . import config, exc
+
+log = logging.getLogger(__name__)
+
+_registry: Optional[HostRegistry] = None
+_registry_lock = threading.Lock()
+
+
+class HostSettings(NamedTuple):
+    failure_threshold: int
+    cooldown: float
+    max_concurrency: int
+    min_interval: float
+    wait_timeout: float
+
+    @classmethod
+    def from_config(cls) -> HostSettings:
+        return cls(
+            failure_threshold=config.host_failure_threshold(),
+            cooldown=config.host_cooldown(),
+            max_concurrency=config.host_concurrency(),
+            min_interval=config.host_interval(),
+            wait_timeout=config.remote_timeout(),
+        )
+
+
+class HostState:
+    """Health of the single remote host.
+
+    Concurrency limit and interval between requests are adjusted using
+    additive-increase/multiplicative-decrease: every success relaxes
+    limits, every failure tightens them. After `failure_threshold`
+    consecutive failures circuit opens and host is skipped for `cooldown`
+    seconds. When cooldown is over, a single trial request decides whether
+    circuit closes or opens again.
+    """
+
+    def __init__(self, settings: HostSettings):
+        self.settings = settings
+        self.failures = 0
+        self.open_until = 0.0
+        self.limit = float(settings.max_concurrency)
+        self.active = 0
+        self.interval = settings.min_interval
+        self.next_request = 0.0
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+    def is_half_open(self, now: float) -> bool:
+        return (
+            self.failures >= self.settings.failure_threshold
+            and not self.is_open(now)
+        )
+
+    def capacity(self, now: float) -> int:
+        if self.is_half_open(now):
+            return 1
+        return max(1, int(self.limit))
+
+    def success(self):
+        self.failures = 0
+        self.limit = min(self.settings.max_concurrency, self.limit + 1)
+        self.interval = max(self.settings.min_interval, self.interval / 2)
+
+    def failure(self, now: float, retry_after: Optional[float]):
+        self.failures += 1
+        self.limit = max(1.0, self.limit / 2)
+        self.interval = min(
+            self.settings.cooldown,
+            max(self.settings.min_interval, self.interval * 2, 0.5),
+        )
+
+        if retry_after:
+            self.open_until = max(
+                self.open_until, now + min(retry_after, self.settings.cooldown)
+            )
+        elif self.failures >= self.settings.failure_threshold:
+            self.open_until = now + self.settings.cooldown
+
+
+class HostSlot:
+    """Permission to make a single request to the host.
+
+    Report the outcome of request using `success` or `failure`. Slot that
+    was released without reporting counts as a success, unless it was
+    released because of an exception. Such exceptions are not caused by the
+    host, so they are not reported at all.
+    """
+
+    def __init__(self, registry: HostRegistry, host: str):
+        self.registry = registry
+        self.host = host
+        self.reported = False
+
+    def success(self):
+        self.reported = True
+        self.registry._report(self.host, True, None)
+
+    def failure(self, retry_after: Optional[float] = None):
+        self.reported = True
+        self.registry._report(self.host, False, retry_after)
+
+
+class HostRegistry:
+    """Process-wide tracker of remote hosts health.
+
+    Circuit breaker and interval between requests work in any process.
+    Concurrency limit matters only when multiple threads download files at
+    the same time(e.g, threaded web server). Single-threaded loops, like
+    `rebuild` and `worker` commands, never have more than one active
+    request.
+    """
+
+    def __init__(
+        self,
+        settings: HostSettings,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.settings = settings
+        self.clock = clock
+        self.hosts: dict[str, HostState] = {}
+        self.skipped: Counter[str] = Counter()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[HostSlot]:
+        """Wait for the opportunity to make a request to the URL's host.
+
+        Raises:
+            HostUnavailableError: circuit is open or host is too busy
+        """
+        host = urlparse(url).netloc.lower()
+        self._acquire(host)
+        slot = HostSlot(self, host)
+        try:
+            yield slot
+        except BaseException:
+            slot.reported = True
+            raise
+        finally:
+            if not slot.reported:
+                slot.success()
+            with self._cond:
+                self.hosts[host].active -= 1
+                self._cond.notify_all()
+
+    def report(self) -> dict[str, int]:
+        """Number of skipped requests per host."""
+        with self._cond:
+            return dict(self.skipped)
+
+    def _acquire(self, host: str):
+        deadline = self.clock() + self.settings.wait_timeout
+        with self._cond:
+            state = self.hosts.setdefault(host, HostState(self.settings))
+            while True:
+                now = self.clock()
+                if state.is_open(now):
+                    self.skipped[host] += 1
+                    raise exc.HostUnavailableError(host, "circuit is open")
+
+                delay = state.next_request - now
+                if state.active < state.capacity(now) and delay <= 0:
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.skipped[host] += 1
+                    raise exc.HostUnavailableError(host, "host is busy")
+
+                self._cond.wait(min(remaining, max(delay, 0.01)))
+
+            state.active += 1
+            state.next_request = now + state.interval
+
+    def _report(self, host: str, ok: bool, retry_after: Optional[float]):
+        with self._cond:
+            state = self.hosts[host]
+            if ok:
+                state.success()
+            else:
+                state.failure(self.clock(), retry_after)
+                if state.is_open(self.clock()):
+                    log.warning(
+                        "Host %s is skipped for %.0f seconds after %d"
+                        " failures",
+                        host,
+                        state.open_until - self.clock(),
+                        state.failures,
+                    )
+            self._cond.notify_all()
+
+
+def get_registry() -> HostRegistry:
+    """Registry shared by all the threads of the current process.
+
+    Registry is re-created when related config options are changed.
+    """
+    global _registry
+
+    settings = HostSettings.from_config()
+    with _registry_lock:
+        if _registry is None or _registry.settings != settings:
+            _registry = HostRegistry(settings)
+        return _registry
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convert Retry-After header with delay in seconds into number."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
@@ -3,7 +3,7 @@ from __future__ import annotations
 from typing import Any
 
 import ckan.plugins.interfaces as interfaces
-from ckanext.resource_indexer.utils import Weight
+from ckanext.resource_indexer.utils import ResourceFile, Weight
 
 
 class IResourceIndexer(interfaces.Interface):
@@ -40,6 +40,24 @@ class IResourceIndexer(interfaces.Interface):
         """
         return []
 
+    def extract_indexable_chunks_from_buffer(self, file: ResourceFile) -> Any:
+        """Extract indexable data from the opened resource file.
+
+        Optional alternative to `extract_indexable_chunks`. Implement it in
+        order to work with the content of the file without reading it
+        again. Content must not be used after the method returns, unless it
+        was copied: returned generator is consumed while the file is open.
+
+        Args:
+            file: opened file. Content is available as `file.buffer`
+                memoryview, path is available as `file.path`
+
+        Returns:
+            all meaningfuld pieces of data with no type assumption
+
+        """
+        return self.extract_indexable_chunks(file.path)
+
     def merge_chunks_into_index(self, pkg_dict: dict[str, Any], chunks: Any):
         """Merge data into the package dictionary.
 
@@ -0,0 +1,11 @@
+from __future__ import annotations
+
+from . import utils
+
+
+def reindex_package(package_id: str):
+    """Index the package with all resources, ignoring time budget."""
+    from ckan.lib.search import rebuild
+
+    with utils.unlimited_indexation():
+        rebuild(package_id)
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import codecs
+import logging
+import re
+import xml.sax
+from html.parser import HTMLParser
+from typing import Any, Iterable, Iterator, Optional
+
+from . import config, exc, utils
+
+log = logging.getLogger(__name__)
+
+HTML_FORMATS = {"html", "htm", "xhtml"}
+XML_FORMATS = {"xml"}
+MARKUP_FORMATS = HTML_FORMATS | XML_FORMATS
+CHUNK_SIZE = 1024 * 64
+
+RE_WHITESPACE = re.compile(r"\s+")
+RE_LAST_WORD = re.compile(r"\s(\S*)\Z")
+
+
+class _TextCollector:
+    """Visible text and selected attributes of the document.
+
+    Content of skipped elements is ignored. Collected text is drained after
+    every portion of the document, so memory usage does not depend on the
+    size of the document.
+    """
+
+    def __init__(
+        self,
+        attributes: Iterable[str],
+        skip_tags: Iterable[str],
+        inline_tags: Iterable[str] = (),
+    ):
+        self.attributes = set(attributes)
+        self.skip_tags = set(skip_tags)
+        self.inline_tags = set(inline_tags)
+        self.parts: list[str] = []
+        self.skipped: list[str] = []
+
+    def start(self, tag: str, attrs: Iterable[tuple[str, Optional[str]]]):
+        tag = tag.lower()
+        if self.skipped:
+            self.skipped.append(tag)
+            return
+
+        # elements separate words, unless they are inline. Skipped element
+        # separates text around it as well
+        if tag not in self.inline_tags or tag in self.skip_tags:
+            self.parts.append(" ")
+
+        if tag in self.skip_tags:
+            self.skipped.append(tag)
+            return
+
+        for name, value in attrs:
+            if value and name.lower() in self.attributes:
+                self.parts.extend((value, " "))
+
+    def end(self, tag: str):
+        tag = tag.lower()
+        if tag in self.skipped:
+            # close unclosed elements as well
+            while self.skipped.pop() != tag:
+                pass
+            if not self.skipped:
+                self.parts.append(" ")
+        elif not self.skipped and tag not in self.inline_tags:
+            self.parts.append(" ")
+
+    def data(self, text: str):
+        if not self.skipped:
+            self.parts.append(text)
+
+    def drain(self, final: bool = False) -> str:
+        """Collected text with normalized whitespaces.
+
+        Unless it's the final portion, the last word is kept until the next
+        portion, because it may continue there.
+        """
+        text = "".join(self.parts)
+        self.parts = []
+
+        if not final:
+            match = RE_LAST_WORD.search(text)
+            if match:
+                self.parts.append(match.group(1))
+                text = text[: match.start(1)]
+            elif len(text) < CHUNK_SIZE:
+                self.parts.append(text)
+                text = ""
+
+        return RE_WHITESPACE.sub(" ", text)
+
+
+class _HtmlParser(HTMLParser):
+    def __init__(self, collector: _TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self.collector.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+# elements that do not separate words
+INLINE_ELEMENTS = {
+    "a",
+    "abbr",
+    "b",
+    "bdi",
+    "bdo",
+    "cite",
+    "code",
+    "data",
+    "dfn",
+    "em",
+    "font",
+    "i",
+    "kbd",
+    "mark",
+    "q",
+    "s",
+    "samp",
+    "small",
+    "span",
+    "strong",
+    "sub",
+    "sup",
+    "time",
+    "u",
+    "var",
+}
+
+# elements that never have content or closing tag
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+
+
+class _SaxHandler(xml.sax.handler.ContentHandler):
+    def __init__(self, collector: _TextCollector):
+        super().__init__()
+        self.collector = collector
+
+    def startElement(self, name, attrs):
+        self.collector.start(
+            _local(name), ((_local(k), v) for k, v in attrs.items())
+        )
+
+    def endElement(self, name):
+        self.collector.end(_local(name))
+
+    def characters(self, content):
+        self.collector.data(content)
+
+
+def _local(name: str) -> str:
+    """Name of the element without namespace prefix."""
+    return name.rpartition(":")[2]
+
+
+def extract_markup(file: utils.ResourceFile) -> Iterator[str]:
+    """Extract visible text from HTML or XML document.
+
+    Type of the document is taken from the format of resource. Document is
+    parsed incrementally and text is produced in chunks, without building
+    the document tree.
+    """
+    res = utils.current_resource.get()
+    fmt = (res or {}).get("format", "").lower()
+    attributes = config.markup_attributes()
+    skip_tags = config.markup_skip_tags()
+
+    if fmt in XML_FORMATS:
+        chunks = _parse_xml(file, _TextCollector(attributes, skip_tags))
+    else:
+        chunks = _parse_html(
+            file, _TextCollector(attributes, skip_tags, INLINE_ELEMENTS)
+        )
+
+    for text in chunks:
+        if text:
+            yield text
+
+
+def _portions(file: utils.ResourceFile) -> Iterator[bytes]:
+    # read the file in blocks instead of using the buffer, that holds the
+    # whole file in memory when file is not mapped
+    with open(file.path, "rb") as src:
+        yield from iter(lambda: src.read(CHUNK_SIZE), b"")
+
+
+def _parse_html(
+    file: utils.ResourceFile, collector: _TextCollector
+) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf8")(errors="replace")
+    parser = _HtmlParser(collector)
+    for portion in _portions(file):
+        parser.feed(decoder.decode(portion))
+        yield collector.drain()
+
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield collector.drain(final=True)
+
+
+def _parse_xml(
+    file: utils.ResourceFile, collector: _TextCollector
+) -> Iterator[str]:
+    parser: Any = xml.sax.make_parser()
+    # never load external entities and DTDs
+    parser.setFeature(xml.sax.handler.feature_external_ges, False)
+    parser.setFeature(xml.sax.handler.feature_external_pes, False)
+    parser.setContentHandler(_SaxHandler(collector))
+
+    try:
+        for portion in _portions(file):
+            parser.feed(portion)
+            yield collector.drain()
+        parser.close()
+    except xml.sax.SAXParseException as e:
+        log.debug("Cannot parse XML %s: %s", file.path, e)
+        raise exc.UnexpectedContentError(file.path)
+
+    yield collector.drain(final=True)
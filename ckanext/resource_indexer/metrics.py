@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Iterator, Optional
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_initialized: set[str] = set()
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS package_timing (
+        package_id TEXT PRIMARY KEY,
+        duration REAL NOT NULL,
+        updated REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resource_content (
+        resource_id TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        format TEXT NOT NULL,
+        chunks TEXT NOT NULL,
+        updated REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resource_stats (
+        resource_id TEXT NOT NULL,
+        handler TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        format TEXT NOT NULL,
+        chars INTEGER NOT NULL,
+        printable_ratio REAL,
+        error TEXT,
+        duration REAL NOT NULL,
+        updated REAL NOT NULL,
+        PRIMARY KEY (resource_id, handler)
+    )
+    """,
+]
+
+
+class MetricsStore:
+    """Local SQLite storage for indexation metrics.
+
+    Every process opens its own short-living connection for each operation,
+    so the store can be shared by web workers and CLI commands running on
+    the same node.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        with _lock:
+            if self.path not in _initialized:
+                folder = os.path.dirname(self.path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                with contextlib.closing(sqlite3.connect(self.path)) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    for statement in SCHEMA:
+                        conn.execute(statement)
+                    conn.commit()
+                _initialized.add(self.path)
+
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_package(self, package_id: str, duration: float):
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO package_timing"
+                " (package_id, duration, updated) VALUES (?, ?, ?)",
+                (package_id, duration, time.time()),
+            )
+
+    def package_durations(self, ids: Iterable[str]) -> dict[str, float]:
+        """Duration of the last indexation of every package."""
+        ids = list(ids)
+        result = {}
+        with self.connect() as conn:
+            # stay below the limit on the number of SQL variables
+            for start in range(0, len(ids), 500):
+                batch = ids[start : start + 500]
+                rows = conn.execute(
+                    "SELECT package_id, duration FROM package_timing"
+                    " WHERE package_id IN ({})".format(
+                        ", ".join("?" * len(batch))
+                    ),
+                    batch,
+                )
+                result.update(rows)
+        return result
+
+    def get_content(
+        self, resource_id: str, fingerprint: str
+    ) -> Optional[tuple[str, Any]]:
+        """Format and chunks extracted from the same version of resource."""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT format, chunks FROM resource_content"
+                " WHERE resource_id = ? AND fingerprint = ?",
+                (resource_id, fingerprint),
+            ).fetchone()
+
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def set_content(
+        self, resource_id: str, fingerprint: str, fmt: str, chunks: Any
+    ):
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO resource_content"
+                " (resource_id, fingerprint, format, chunks, updated)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    resource_id,
+                    fingerprint,
+                    fmt,
+                    json.dumps(chunks),
+                    time.time(),
+                ),
+            )
+
+    def drop_content(self, ids: Iterable[str]):
+        with self.connect() as conn:
+            conn.executemany(
+                "DELETE FROM resource_content WHERE resource_id = ?",
+                [(id_,) for id_ in ids],
+            )
+
+    def clear_content(self) -> int:
+        with self.connect() as conn:
+            return conn.execute("DELETE FROM resource_content").rowcount
+
+    def record_resource(
+        self,
+        resource_id: str,
+        handler: str,
+        content_hash: str,
+        fmt: str,
+        chars: int,
+        printable_ratio: Optional[float],
+        error: Optional[str],
+        duration: float,
+    ):
+        """Remember the outcome of the latest extraction by the handler."""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO resource_stats (resource_id, handler,"
+                " content_hash, format, chars, printable_ratio, error,"
+                " duration, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    resource_id,
+                    handler,
+                    content_hash,
+                    fmt,
+                    chars,
+                    printable_ratio,
+                    error,
+                    duration,
+                    time.time(),
+                ),
+            )
+
+    def empty_handlers(self, resource_id: str, content_hash: str) -> set[str]:
+        """Handlers that produced nothing from the same content."""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT handler FROM resource_stats WHERE resource_id = ?"
+                " AND content_hash = ? AND chars = 0 AND error IS NULL",
+                (resource_id, content_hash),
+            )
+            return {row[0] for row in rows}
+
+    def stats_summary(self) -> list[sqlite3.Row]:
+        """Aggregated outcomes of extraction per handler and format."""
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return conn.execute(
+                "SELECT handler, format, COUNT(*) AS resources,"
+                " SUM(chars = 0 AND error IS NULL) AS empty,"
+                " SUM(error IS NOT NULL) AS errors,"
+                " SUM(chars) AS chars,"
+                " AVG(printable_ratio) AS printable_ratio,"
+                " SUM(duration) AS duration"
+                " FROM resource_stats GROUP BY handler, format"
+                " ORDER BY duration DESC"
+            ).fetchall()
+
+    def stats_problems(
+        self, min_printable_ratio: float, limit: int
+    ) -> list[sqlite3.Row]:
+        """Resources that produced nothing, garbage or errors."""
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return conn.execute(
+                "SELECT * FROM resource_stats WHERE chars = 0"
+                " OR error IS NOT NULL OR printable_ratio < ?"
+                " ORDER BY duration DESC LIMIT ?",
+                (min_printable_ratio, limit),
+            ).fetchall()
+
+
+def get_store() -> Optional[MetricsStore]:
+    """Store configured by `ckanext.resource_indexer.metrics_path`."""
+    path = config.metrics_path()
+    if not path:
+        return None
+    return MetricsStore(path)
@@ -0,0 +1,32 @@
+"""Create queue table
+
+Revision ID: 3f0a8c2d9b61
+Revises:
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f0a8c2d9b61"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "resource_indexer_queue",
+        sa.Column("package_id", sa.UnicodeText, primary_key=True),
+        sa.Column("priority", sa.Integer, nullable=False, default=0),
+        sa.Column("enqueued", sa.Float, nullable=False),
+        sa.Column("claimed_by", sa.UnicodeText),
+        sa.Column("lease_until", sa.Float),
+        sa.Column("attempts", sa.Integer, nullable=False, default=0),
+    )
+
+
+def downgrade():
+    op.drop_table("resource_indexer_queue")
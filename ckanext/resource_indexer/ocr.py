@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from . import config, utils
+
+log = logging.getLogger(__name__)
+
+
+class OcrSettings(NamedTuple):
+    """Snapshot of OCR configuration.
+
+    Pages are recognised inside worker threads, so config is read once and
+    passed to every task explicitly.
+    """
+
+    pdftoppm: list[str]
+    tesseract: list[str]
+    language: str
+    dpi: int
+    timeout: int
+    cache_dir: Optional[str]
+
+    @classmethod
+    def from_config(cls) -> OcrSettings:
+        return cls(
+            pdftoppm=config.ocr_pdftoppm_command(),
+            tesseract=config.ocr_tesseract_command(),
+            language=config.ocr_language(),
+            dpi=config.ocr_dpi(),
+            timeout=config.ocr_timeout(),
+            cache_dir=config.ocr_cache_dir(),
+        )
+
+
+def extract_pdf_with_ocr(
+    path: str, digest: Optional[Callable[[], str]] = None
+) -> Iterable[str]:
+    """Extract text from PDF, recognising pages without a text layer.
+
+    Pages are taken from `pdftotext` as usual. Only pages that contain less
+    than `ckanext.resource_indexer.ocr.min_chars` characters are sent to
+    OCR, and no more than `ckanext.resource_indexer.ocr.page_budget` of them.
+
+    `digest` returns SHA256 of the file, when it's already known(i.e,
+    `ResourceFile.digest`). Otherwise the file is hashed again when results
+    are cached.
+    """
+    processor = config.pdf_processor()
+    pages = list(utils.read_pdf_pages(path))
+
+    min_chars = config.ocr_min_chars()
+    candidates = [
+        idx for idx, page in enumerate(pages) if len(page.strip()) < min_chars
+    ]
+
+    budget = config.ocr_page_budget()
+    if budget and len(candidates) > budget:
+        log.warning(
+            "File %s has %d pages without text, but only %d of them will be"
+            " recognised",
+            path,
+            len(candidates),
+            budget,
+        )
+        candidates = candidates[:budget]
+
+    recognised = (
+        recognise_pages(path, candidates, digest) if candidates else {}
+    )
+
+    for idx, page in enumerate(pages):
+        yield processor(recognised.get(idx) or page)
+
+
+def recognise_pages(
+    path: str, pages: list[int], digest: Optional[Callable[[], str]] = None
+) -> dict[int, str]:
+    """Recognise text on the given pages(0-based) of PDF file."""
+    settings = OcrSettings.from_config()
+    source = ""
+    if settings.cache_dir:
+        source = digest() if digest else _file_digest(path)
+    tasks = [(path, source, idx, settings) for idx in pages]
+
+    workers = min(config.ocr_workers(), len(tasks))
+    if workers > 1:
+        # the real work happens in pdftoppm and tesseract subprocesses, so
+        # threads that wait for them are enough
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(_recognise_page, tasks))
+    else:
+        results = [_recognise_page(task) for task in tasks]
+
+    return {idx: text for idx, text in results if text}
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as src:
+        for block in iter(lambda: src.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _page_digest(source: str, idx: int, settings: OcrSettings) -> str:
+    """Cache key of the page, known before the page is rasterized."""
+    key = f"{source}:{idx}:{settings.dpi}:{settings.language}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _recognise_page(
+    task: tuple[str, str, int, OcrSettings]
+) -> tuple[int, str]:
+    path, source, idx, settings = task
+
+    digest = _page_digest(source, idx, settings)
+    text = _cache_get(settings, digest)
+    if text is not None:
+        return idx, text
+
+    try:
+        image = _rasterize(path, idx, settings)
+    except (OSError, subprocess.SubprocessError) as e:
+        log.warning("Cannot rasterize page %d of %s: %s", idx + 1, path, e)
+        return idx, ""
+
+    try:
+        text = _tesseract(image, settings)
+    except (OSError, subprocess.SubprocessError) as e:
+        log.warning("Cannot recognise page %d of %s: %s", idx + 1, path, e)
+        return idx, ""
+
+    _cache_set(settings, digest, text)
+    return idx, text
+
+
+def _rasterize(path: str, idx: int, settings: OcrSettings) -> bytes:
+    page = str(idx + 1)
+    with tempfile.TemporaryDirectory() as folder:
+        root = os.path.join(folder, "page")
+        subprocess.run(
+            [
+                *settings.pdftoppm,
+                "-f",
+                page,
+                "-l",
+                page,
+                "-r",
+                str(settings.dpi),
+                "-singlefile",
+                "-png",
+                path,
+                root,
+            ],
+            check=True,
+            capture_output=True,
+            timeout=settings.timeout,
+        )
+        with open(root + ".png", "rb") as image:
+            return image.read()
+
+
+def _tesseract(image: bytes, settings: OcrSettings) -> str:
+    result = subprocess.run(
+        [*settings.tesseract, "stdin", "stdout", "-l", settings.language],
+        input=image,
+        check=True,
+        capture_output=True,
+        timeout=settings.timeout,
+    )
+    return result.stdout.decode(errors="replace")
+
+
+def _cache_path(settings: OcrSettings, digest: str) -> Optional[str]:
+    if not settings.cache_dir:
+        return None
+    return os.path.join(settings.cache_dir, digest[:2], digest + ".txt")
+
+
+def _cache_get(settings: OcrSettings, digest: str) -> Optional[str]:
+    path = _cache_path(settings, digest)
+    if not path:
+        return None
+
+    try:
+        with open(path, encoding="utf8") as src:
+            return src.read()
+    except OSError:
+        return None
+
+
+def _cache_set(settings: OcrSettings, digest: str, text: str):
+    path = _cache_path(settings, digest)
+    if not path:
+        return
+
+    folder = os.path.dirname(path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        # write into temporary file first, so that parallel workers never
+        # read a partially written entry
+        fd, tmp = tempfile.mkstemp(dir=folder)
+        with os.fdopen(fd, "w", encoding="utf8") as dest:
+            dest.write(text)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("Cannot cache OCR result %s: %s", digest, e)
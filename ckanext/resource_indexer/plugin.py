@@ -4,7 +4,7 @@ from __future__ import annotations
 import logging
 import json
 
-from typing import Any
+from typing import Any, Optional
 
 import ckan.plugins as p
 from ckan.lib.search.query import QUERY_FIELDS
@@ -12,15 +12,28 @@ from ckan.lib.search.query import QUERY_FIELDS
 import ckanext.resource_indexer.interface as interface
 import ckanext.resource_indexer.utils as utils
 
-from . import config, cli
+from . import config
 
 log = logging.getLogger(__name__)
 
 
+def _is_resource(data: dict[str, Any]) -> bool:
+    return "package_id" in data and "url" in data
+
+
 class ResourceIndexerPlugin(p.SingletonPlugin):
     p.implements(p.IPackageController, inherit=True)
+    p.implements(p.IResourceController, inherit=True)
+    p.implements(p.IConfigurable)
     p.implements(p.IClick)
 
+    _boost_string: Optional[str] = None
+
+    # IConfigurable
+
+    def configure(self, config_):
+        self._boost_string = utils.get_boost_string()
+
     # IPackageController
 
     def before_dataset_index(self, pkg_dict):
@@ -30,22 +43,102 @@ class ResourceIndexerPlugin(p.SingletonPlugin):
         resources = json.loads(pkg_dict["validated_data_dict"]).get(
             "resources", []
         )
-        for res in utils.select_indexable_resources(resources):
-            utils.index_resource(res, pkg_dict)
+        utils.index_resources(
+            utils.select_indexable_resources(resources), pkg_dict
+        )
         return pkg_dict
 
     def before_dataset_search(self, search_params):
-        boost = utils.get_boost_string()
-        if boost:
+        if self._boost_string:
             search_params.setdefault("qf", QUERY_FIELDS)
-            search_params["qf"] += " " + boost
+            search_params["qf"] += " " + self._boost_string
         return search_params
 
+    def after_dataset_delete(self, context, pkg_dict):
+        if config.content_mode() != config.ContentMode.child:
+            return
+
+        try:
+            utils.delete_child_documents(pkg_dict["id"])
+        except Exception:
+            log.exception(
+                "Cannot remove resources of package %s from the index",
+                pkg_dict["id"],
+            )
+
     before_index = before_dataset_index
     before_search = before_dataset_search
 
+    # IResourceController
+
+    def after_resource_create(self, context, resource):
+        self._update_resource_field(resource)
+
+    def before_resource_update(self, context, current, resource):
+        if resource.get("upload") not in (None, ""):
+            # file replaced, but metadata that identifies its version may
+            # stay the same
+            utils.invalidate_content([current["id"]])
+
+    def after_resource_update(self, context, resource):
+        self._update_resource_field(resource)
+
+    def before_resource_delete(self, context, resource, resources):
+        utils.invalidate_content([resource["id"]])
+        current = next(
+            (r for r in resources if r["id"] == resource["id"]), None
+        )
+        if current:
+            context["resource_indexer_deleted"] = current
+
+    def after_resource_delete(self, context, resources):
+        deleted = context.pop("resource_indexer_deleted", None)
+        if deleted:
+            self._update_resource_field(dict(deleted, state="deleted"))
+
+    # CKAN<2.10 uses the same names for hooks of IPackageController and
+    # IResourceController, so both packages and resources end up here
+
+    def after_create(self, context, data):
+        if _is_resource(data):
+            self.after_resource_create(context, data)
+
+    def after_update(self, context, data):
+        if _is_resource(data):
+            self.after_resource_update(context, data)
+
+    def after_delete(self, context, data):
+        # resource hook receives the list of remaining resources
+        if isinstance(data, list):
+            self.after_resource_delete(context, data)
+        else:
+            self.after_dataset_delete(context, data)
+
+    before_update = before_resource_update
+    before_delete = before_resource_delete
+
+    def _update_resource_field(self, resource: dict[str, Any]):
+        if not config.atomic_updates():
+            return
+
+        if config.content_mode() != config.ContentMode.field:
+            log.warning(
+                "%s requires `field` content mode",
+                config.CONFIG_ATOMIC_UPDATES,
+            )
+            return
+
+        try:
+            utils.update_resource_field(resource)
+        except Exception:
+            log.exception(
+                "Cannot update content of resource %s", resource["id"]
+            )
+
     # IClick
     def get_commands(self):
+        from . import cli
+
         return cli.get_commands()
 
 
@@ -67,6 +160,33 @@ class PdfResourceIndexerPlugin(p.SingletonPlugin):
         return utils.merge_text_chunks(pkg_dict, chunks)
 
 
+class OcrPdfResourceIndexerPlugin(p.SingletonPlugin):
+    p.implements(interface.IResourceIndexer)
+
+    # IResourceIndexer
+
+    def get_resource_indexer_weight(self, res):
+        fmt = res["format"].lower()
+        if fmt == "pdf":
+            return utils.Weight.default
+        return utils.Weight.skip
+
+    def extract_indexable_chunks(self, path):
+        from . import ocr
+
+        return ocr.extract_pdf_with_ocr(path)
+
+    def extract_indexable_chunks_from_buffer(self, file):
+        from . import ocr
+
+        # cache of pages is keyed by the digest that is shared with
+        # statistics and content cache
+        return ocr.extract_pdf_with_ocr(file.path, file.digest)
+
+    def merge_chunks_into_index(self, pkg_dict, chunks):
+        return utils.merge_text_chunks(pkg_dict, chunks)
+
+
 class PlainResourceIndexerPlugin(p.SingletonPlugin):
     p.implements(interface.IResourceIndexer)
 
@@ -82,6 +202,61 @@ class PlainResourceIndexerPlugin(p.SingletonPlugin):
     def extract_indexable_chunks(self, path):
         return utils.extract_plain(path)
 
+    def extract_indexable_chunks_from_buffer(self, file):
+        return utils.extract_plain_buffer(file)
+
+    def merge_chunks_into_index(self, pkg_dict, chunks):
+        return utils.merge_text_chunks(pkg_dict, chunks)
+
+
+class ArchiveResourceIndexerPlugin(p.SingletonPlugin):
+    p.implements(interface.IResourceIndexer)
+
+    # IResourceIndexer
+
+    def get_resource_indexer_weight(self, res):
+        from . import archive
+
+        fmt = res["format"].lower()
+        if fmt in archive.ARCHIVE_FORMATS:
+            return utils.Weight.handler
+        return utils.Weight.skip
+
+    def extract_indexable_chunks(self, path):
+        from . import archive
+
+        return archive.extract_archive(path)
+
+    def merge_chunks_into_index(self, pkg_dict, chunks):
+        from . import archive
+
+        return archive.merge_archive(pkg_dict, chunks)
+
+
+class MarkupResourceIndexerPlugin(p.SingletonPlugin):
+    p.implements(interface.IResourceIndexer)
+
+    # IResourceIndexer
+
+    def get_resource_indexer_weight(self, res):
+        from . import markup
+
+        fmt = res["format"].lower()
+        if fmt in markup.MARKUP_FORMATS:
+            return utils.Weight.handler
+        return utils.Weight.skip
+
+    def extract_indexable_chunks(self, path):
+        from . import markup
+
+        with utils.ResourceFile(path, config.mmap_uploads()) as file:
+            yield from markup.extract_markup(file)
+
+    def extract_indexable_chunks_from_buffer(self, file):
+        from . import markup
+
+        return markup.extract_markup(file)
+
     def merge_chunks_into_index(self, pkg_dict, chunks):
         return utils.merge_text_chunks(pkg_dict, chunks)
 
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import enum
+import hashlib
+from typing import Any, Iterable, Optional
+
+from . import config
+
+# estimated seconds spent on every indexable resource, regardless of size
+RESOURCE_COST = 0.05
+# estimated seconds spent on download of remote resource
+REMOTE_COST = 0.5
+# size of the resource that has no `size` field, in MB
+DEFAULT_SIZE = 1.0
+
+
+class Order(str, enum.Enum):
+    """Order of packages during rebuild."""
+
+    # as returned by the database
+    none = "none"
+    # the most expensive first. Minimizes total duration when work is
+    # distributed between multiple workers
+    longest = "longest"
+    # the cheapest first. Makes the most of packages searchable early
+    cheapest = "cheapest"
+
+
+def estimate_resource(res: dict[str, Any]) -> float:
+    """Estimated number of seconds required for indexing the resource."""
+    fmt = (res.get("format") or "").lower()
+    factors = config.format_cost()
+    factor = factors.get(fmt, factors.get("*", 0.1))
+
+    try:
+        size = int(res.get("size") or 0) / 1024**2
+    except (TypeError, ValueError):
+        size = 0
+    if not size:
+        size = DEFAULT_SIZE
+
+    cost = RESOURCE_COST + size * factor
+    if res.get("url_type") != "upload":
+        cost += REMOTE_COST
+    return cost
+
+
+def estimate_packages(ids: Iterable[str]) -> dict[str, float]:
+    """Estimated number of seconds required for indexing every package.
+
+    Duration of the previous indexation, if recorded, is used as is.
+    Otherwise, cost is computed using size and format of indexable
+    resources.
+    """
+    from ckan import model
+
+    ids = list(ids)
+    costs = dict.fromkeys(ids, 0.0)
+    formats = config.indexable_formats()
+
+    for start in range(0, len(ids), 1000):
+        batch = ids[start : start + 1000]
+        q = model.Session.query(
+            model.Resource.package_id,
+            model.Resource.format,
+            model.Resource.size,
+            model.Resource.url_type,
+        ).filter(
+            model.Resource.package_id.in_(batch),
+            model.Resource.state == "active",
+        )
+        for package_id, fmt, size, url_type in q:
+            if (fmt or "").lower() not in formats:
+                continue
+            costs[package_id] += estimate_resource(
+                {"format": fmt, "size": size, "url_type": url_type}
+            )
+
+    from . import metrics
+
+    store = metrics.get_store()
+    if store:
+        costs.update(store.package_durations(ids))
+
+    return costs
+
+
+def order(ids: list[str], costs: dict[str, float], how: Order) -> list[str]:
+    if how == Order.longest:
+        return sorted(ids, key=lambda id_: -costs.get(id_, 0))
+    if how == Order.cheapest:
+        return sorted(ids, key=lambda id_: costs.get(id_, 0))
+    return ids
+
+
+def split_expensive(
+    ids: list[str], costs: dict[str, float], threshold: Optional[float]
+) -> tuple[list[str], list[str]]:
+    """Separate packages that are more expensive than threshold."""
+    if threshold is None:
+        return ids, []
+
+    regular = [id_ for id_ in ids if costs.get(id_, 0) <= threshold]
+    expensive = [id_ for id_ in ids if costs.get(id_, 0) > threshold]
+    return regular, expensive
+
+
+def partition(ids: Iterable[str], workers: int) -> list[list[str]]:
+    """Distribute packages between workers using hash of package ID.
+
+    Worker of the package depends only on its ID, so every worker computes
+    the same partition independently, even on different nodes, when
+    recorded durations differ, or when packages are added in between.
+    Large number of packages is split into parts of similar cost.
+    """
+    bins: list[list[str]] = [[] for _ in range(workers)]
+    for id_ in ids:
+        digest = hashlib.sha1(id_.encode()).digest()
+        bins[int.from_bytes(digest[:8], "big") % workers].append(id_)
+
+    return bins
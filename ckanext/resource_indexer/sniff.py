@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+# libmagic needs only the beginning of the file
+SNIFF_SIZE = 4096
+CACHE_SIZE = 256
+
+EMPTY_MIMETYPES = {"application/x-empty", "inode/x-empty"}
+
+TEXT = ("text/", "application/json", "application/csv", "application/xml")
+MARKUP = ("text/html", "text/xml", "application/xml", "application/xhtml")
+GZIP = ("application/gzip", "application/x-gzip")
+
+# mimetypes that are acceptable for the given format. Unlisted formats are
+# never rerouted
+EXPECTED_MIMETYPES: dict[str, tuple[str, ...]] = {
+    "pdf": ("application/pdf",),
+    "txt": TEXT,
+    "csv": TEXT,
+    "tsv": TEXT,
+    "json": TEXT,
+    "yaml": TEXT,
+    "yml": TEXT,
+    "html": MARKUP + ("text/plain",),
+    "htm": MARKUP + ("text/plain",),
+    "xml": MARKUP + ("text/plain",),
+    "zip": ("application/zip",),
+    "gz": GZIP,
+    "gzip": GZIP,
+    "tgz": GZIP,
+    "tar.gz": GZIP,
+    "tar": ("application/x-tar",),
+}
+
+# format used for the content with the given mimetype, when it differs
+# from the declared format
+DETECTED_FORMATS: dict[str, str] = {
+    "application/pdf": "pdf",
+    "text/html": "html",
+    "application/xhtml+xml": "html",
+    "text/xml": "xml",
+    "application/xml": "xml",
+    "application/json": "json",
+    "text/csv": "csv",
+    "text/plain": "txt",
+    "application/zip": "zip",
+    "application/gzip": "gz",
+    "application/x-gzip": "gz",
+    "application/x-tar": "tar",
+}
+
+_cache: OrderedDict[tuple[str, int, int, int], Sniff] = OrderedDict()
+_lock = threading.Lock()
+
+
+class Sniff(NamedTuple):
+    mimetype: str
+    head: bytes
+
+    @property
+    def empty(self) -> bool:
+        return self.mimetype in EMPTY_MIMETYPES
+
+    def is_compatible(self, fmt: str) -> bool:
+        """Check if content can be processed as the given format."""
+        expected = EXPECTED_MIMETYPES.get(fmt.lower())
+        if expected is None:
+            return True
+        return self.mimetype.startswith(expected)
+
+    @property
+    def format(self) -> Optional[str]:
+        """Format that matches the content."""
+        return DETECTED_FORMATS.get(self.mimetype)
+
+
+def sniff(path: str, head: Optional[bytes] = None) -> Sniff:
+    """Detect the type of the file using its first few kilobytes.
+
+    Result is cached for the combination of path, modification time and
+    size, so repeated checks of the same file do not touch the disk. If the
+    beginning of the file was already read, pass it as `head`.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    if head is None:
+        with open(path, "rb") as source:
+            head = source.read(SNIFF_SIZE)
+
+    result = sniff_buffer(head)
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return result
+
+
+def sniff_buffer(head: bytes) -> Sniff:
+    import magic
+
+    head = head[:SNIFF_SIZE]
+    return Sniff(magic.from_buffer(head, True), head)
@@ -0,0 +1,532 @@
+"""In-process servers and load generator for offline load tests.
+
+* `FakeSolr` accepts update requests sent by CKAN(XML or JSON) and
+  records every payload.
+* `RemoteServer` serves files with configurable latency, chunked transfer,
+  failures and size.
+* `index_packages` and `rebuild_packages` push generated packages through
+  the plugin and report throughput and memory usage.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import threading
+import time
+import tracemalloc
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+from urllib.parse import urlparse
+
+
+class _Server:
+    """HTTP server running in the background thread."""
+
+    def __init__(self, handler: type[BaseHTTPRequestHandler]):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.harness = self  # type: ignore
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc: Any):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def harness(self) -> Any:
+        return self.server.harness  # type: ignore
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def send_body(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str = "application/json",
+        headers: Optional[dict[str, str]] = None,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+class Payload(NamedTuple):
+    """Single update request received by Solr."""
+
+    content_type: str
+    # documents added or updated by the request
+    add: list[dict[str, Any]]
+    # IDs and queries of removed documents
+    delete: list[str]
+    commit: bool
+
+
+class FakeSolr(_Server):
+    """Solr stand-in that records updates.
+
+    Added documents are stored in `documents` by their `index_id`(or `id`
+    when `index_id` is missing). Atomic updates(`{"field": {"set": value}}`)
+    are applied to stored documents.
+    """
+
+    def __init__(self, core: str = "ckan"):
+        self.core = core
+        self.payloads: list[Payload] = []
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        super().__init__(_SolrHandler)
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/solr/{self.core}"
+
+    @property
+    def added(self) -> int:
+        """Total number of documents sent to Solr."""
+        return sum(len(payload.add) for payload in self.payloads)
+
+    def record(self, payload: Payload):
+        with self.lock:
+            self.payloads.append(payload)
+            for doc in payload.add:
+                self._apply(doc)
+            for id_ in payload.delete:
+                self.documents.pop(id_, None)
+
+    def _apply(self, doc: dict[str, Any]):
+        key = str(doc.get("index_id") or doc.get("id"))
+        existing = self.documents.get(key)
+        atomic = any(
+            isinstance(v, dict) and v.keys() & {"set", "add", "remove"}
+            for v in doc.values()
+        )
+        if not atomic or existing is None:
+            self.documents[key] = {
+                k: v["set"] if isinstance(v, dict) and "set" in v else v
+                for k, v in doc.items()
+            }
+            return
+
+        for field, value in doc.items():
+            if not isinstance(value, dict):
+                existing[field] = value
+            elif "set" in value:
+                if value["set"] is None:
+                    existing.pop(field, None)
+                else:
+                    existing[field] = value["set"]
+            elif "add" in value:
+                current = existing.get(field, [])
+                if not isinstance(current, list):
+                    current = [current]
+                existing[field] = current + _as_list(value["add"])
+            elif "remove" in value:
+                removed = _as_list(value["remove"])
+                existing[field] = [
+                    v
+                    for v in _as_list(existing.get(field))
+                    if v not in removed
+                ]
+
+    @contextlib.contextmanager
+    def patched(self) -> Iterator[FakeSolr]:
+        """Point CKAN search index to this server."""
+        from ckan.lib.search.common import SolrSettings
+
+        url, user, password = SolrSettings.get()
+        SolrSettings.init(self.url)
+        try:
+            yield self
+        finally:
+            SolrSettings.init(url, user, password)
+
+
+def _as_list(value: Any) -> list[Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+class _SolrHandler(_Handler):
+    def do_GET(self):
+        self.send_body(
+            200,
+            json.dumps(
+                {
+                    "responseHeader": {"status": 0, "QTime": 0},
+                    "response": {"numFound": 0, "start": 0, "docs": []},
+                    "status": "OK",
+                }
+            ).encode(),
+        )
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+
+        if not urlparse(self.path).path.rstrip("/").endswith(
+            ("/update", "/update/json")
+        ):
+            self.send_body(404, b'{"error": "not found"}')
+            return
+
+        try:
+            if "xml" in content_type:
+                payload = _parse_xml_update(content_type, body)
+            else:
+                payload = _parse_json_update(content_type, body)
+        except (ValueError, ET.ParseError) as e:
+            self.send_body(400, json.dumps({"error": str(e)}).encode())
+            return
+
+        self.harness.record(payload)
+        self.send_body(
+            200, b'{"responseHeader": {"status": 0, "QTime": 0}}'
+        )
+
+
+def _parse_xml_update(content_type: str, body: bytes) -> Payload:
+    root = ET.fromstring(body)
+    elements = [root] if root.tag != "update" else list(root)
+    add: list[dict[str, Any]] = []
+    delete: list[str] = []
+    commit = False
+
+    for el in elements:
+        if el.tag == "add":
+            for doc in el.iter("doc"):
+                fields: dict[str, Any] = {}
+                for field in doc.iter("field"):
+                    name = field.get("name", "")
+                    value: Any = field.text or ""
+                    if field.get("update"):
+                        value = {field.get("update"): value}
+                    if name in fields:
+                        fields[name] = _as_list(fields[name]) + [value]
+                    else:
+                        fields[name] = value
+                add.append(fields)
+        elif el.tag == "delete":
+            delete.extend(child.text or "" for child in el)
+        elif el.tag == "commit":
+            commit = True
+
+    return Payload(content_type, add, delete, commit)
+
+
+def _parse_json_update(content_type: str, body: bytes) -> Payload:
+    data = json.loads(body or b"null")
+    if isinstance(data, list):
+        return Payload(content_type, data, [], False)
+
+    if not isinstance(data, dict):
+        raise ValueError("Unsupported update")
+
+    add = data.get("add", [])
+    if isinstance(add, dict):
+        add = [add.get("doc", add)]
+    delete = data.get("delete", [])
+    if not isinstance(delete, list):
+        delete = [delete]
+    delete = [
+        d.get("id") or d.get("query") if isinstance(d, dict) else d
+        for d in delete
+    ]
+    return Payload(content_type, add, delete, "commit" in data)
+
+
+class Behavior(NamedTuple):
+    """The way `RemoteServer` responds with a file."""
+
+    # content of the file, repeated up to `size` bytes when size is set
+    body: bytes = b""
+    size: Optional[int] = None
+    # seconds before response headers are sent
+    latency: float = 0
+    # use chunked transfer encoding without Content-Length header
+    chunked: bool = False
+    chunk_size: int = 64 * 1024
+    # number of initial requests that fail with `failure_status`
+    failures: int = 0
+    failure_status: int = 503
+    headers: Optional[dict[str, str]] = None
+
+    def chunks(self) -> Iterator[bytes]:
+        if self.size is None:
+            for start in range(0, len(self.body), self.chunk_size):
+                yield self.body[start : start + self.chunk_size]
+            return
+
+        pattern = self.body or b"x"
+        # enough repetitions of the pattern for a single chunk
+        block = pattern * (self.chunk_size // len(pattern) + 1)
+        remaining = self.size
+        offset = 0
+        while remaining > 0:
+            step = min(self.chunk_size, remaining)
+            start = offset % len(pattern)
+            yield block[start : start + step]
+            offset += step
+            remaining -= step
+
+    @property
+    def length(self) -> int:
+        return len(self.body) if self.size is None else self.size
+
+
+class RemoteServer(_Server):
+    """HTTP server that imitates remote resources."""
+
+    def __init__(self):
+        self.files: dict[str, Behavior] = {}
+        self.hits: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        super().__init__(_RemoteHandler)
+
+    def add(self, path: str, body: bytes = b"", **options: Any) -> str:
+        """Register the file and return its URL."""
+        path = "/" + path.lstrip("/")
+        self.files[path] = Behavior(body, **options)
+        return self.base_url + path
+
+    def hit(self, path: str) -> tuple[Optional[Behavior], int]:
+        with self.lock:
+            self.hits[path] += 1
+            return self.files.get(path), self.hits[path]
+
+
+class _RemoteHandler(_Handler):
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        behavior, attempt = self.harness.hit(path)
+        if behavior is None:
+            self.send_body(404, b"not found", "text/plain")
+            return
+
+        if behavior.latency:
+            time.sleep(behavior.latency)
+
+        if attempt <= behavior.failures:
+            self.send_body(
+                behavior.failure_status,
+                b"failure",
+                "text/plain",
+                behavior.headers,
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Connection", "close")
+        for name, value in (behavior.headers or {}).items():
+            self.send_header(name, value)
+
+        if not behavior.chunked:
+            self.send_header("Content-Length", str(behavior.length))
+            self.end_headers()
+            if self.command != "HEAD":
+                for chunk in behavior.chunks():
+                    self.wfile.write(chunk)
+            return
+
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        try:
+            for chunk in behavior.chunks():
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # client stopped reading, i.e. because of the size limit
+            pass
+
+
+class LoadReport(NamedTuple):
+    packages: int
+    resources: int
+    # seconds
+    duration: float
+    # bytes allocated at the peak, according to tracemalloc
+    peak_memory: int
+
+    @property
+    def throughput(self) -> float:
+        """Packages per second."""
+        return self.packages / self.duration if self.duration else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.packages} packages({self.resources} resources) in"
+            f" {self.duration:.2f}s: {self.throughput:.1f} packages/s,"
+            f" peak memory {self.peak_memory / 1024**2:.1f}MB"
+        )
+
+
+def make_packages(
+    count: int,
+    resources: int,
+    url: Callable[[int, int], str],
+    fmt: str = "txt",
+) -> Iterator[dict[str, Any]]:
+    """Generate package dictionaries in the form used by the search index.
+
+    Packages are generated lazily, so memory used by the generator does not
+    depend on `count`. URL of the resource is produced by `url(package_idx,
+    resource_idx)`.
+    """
+    for pkg_idx in range(count):
+        pkg_id = str(uuid.uuid4())
+        data = {
+            "id": pkg_id,
+            "name": f"load-test-{pkg_idx}",
+            "resources": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "package_id": pkg_id,
+                    "url": url(pkg_idx, res_idx),
+                    "url_type": "",
+                    "format": fmt,
+                }
+                for res_idx in range(resources)
+            ],
+        }
+        yield {
+            "id": pkg_id,
+            "name": data["name"],
+            "site_id": "default",
+            "validated_data_dict": json.dumps(data),
+        }
+
+
+@contextlib.contextmanager
+def _measure() -> Iterator[Callable[[], tuple[float, int]]]:
+    started = tracemalloc.is_tracing()
+    if not started:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        # python < 3.9 cannot reset the peak without restarting the trace
+        tracemalloc.stop()
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield lambda: (
+            time.perf_counter() - start,
+            tracemalloc.get_traced_memory()[1],
+        )
+    finally:
+        if not started:
+            tracemalloc.stop()
+
+
+def index_packages(
+    packages: Iterable[dict[str, Any]],
+    results: Optional[list[dict[str, Any]]] = None,
+) -> LoadReport:
+    """Push packages through `before_dataset_index` of the plugin.
+
+    Indexed dictionaries are appended to `results`, if it's provided.
+    Otherwise they are dropped immediately.
+    """
+    from ckanext.resource_indexer.plugin import ResourceIndexerPlugin
+
+    plugin = ResourceIndexerPlugin()
+    packages_count = resources_count = 0
+    with _measure() as stats:
+        for pkg_dict in packages:
+            resources_count += len(
+                json.loads(pkg_dict["validated_data_dict"])["resources"]
+            )
+            indexed = plugin.before_dataset_index(pkg_dict)
+            packages_count += 1
+            if results is not None:
+                results.append(indexed)
+        duration, peak = stats()
+
+    return LoadReport(packages_count, resources_count, duration, peak)
+
+
+def create_packages(
+    count: int, resources: int, url: Callable[[int, int], str], fmt="txt"
+) -> list[str]:
+    """Create packages in the database and return their IDs."""
+    from ckan.tests import factories
+
+    return [
+        factories.Dataset(
+            resources=[
+                {"url": url(pkg_idx, res_idx), "format": fmt}
+                for res_idx in range(resources)
+            ]
+        )["id"]
+        for pkg_idx in range(count)
+    ]
+
+
+def rebuild_packages(ids: list[str], *args: str) -> LoadReport:
+    """Index packages using `ckan resource-indexer rebuild`."""
+    from click.testing import CliRunner
+    from ckan import model
+
+    from ckanext.resource_indexer import cli
+
+    resources = (
+        model.Session.query(model.Resource)
+        .filter(
+            model.Resource.package_id.in_(ids),
+            model.Resource.state == "active",
+        )
+        .count()
+    )
+
+    with _measure() as stats:
+        result = CliRunner().invoke(
+            cli.resource_indexer, ["rebuild", *args, *ids]
+        )
+        duration, peak = stats()
+
+    if result.exit_code:
+        raise RuntimeError(result.output) from result.exception
+
+    return LoadReport(len(ids), resources, duration, peak)
@@ -0,0 +1,157 @@
+"""Tests for archive.py."""
+
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+import pytest
+
+from ckanext.resource_indexer import archive, config, exc
+
+
+@pytest.fixture
+def zip_path(tmp_path):
+    path = tmp_path / "archive.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dest:
+        dest.writestr("readme.txt", "hello from zip")
+        dest.writestr("data/table.csv", "a,b\n1,2\n")
+        dest.writestr("image.png", b"\x89PNG\r\n")
+    return str(path)
+
+
+def _text(members):
+    return {m.resource["name"]: "".join(m.chunks) for m in members}
+
+
+@pytest.mark.usefixtures("with_plugins")
+@pytest.mark.ckan_config(
+    "ckan.plugins", "resource_indexer plain_resource_indexer"
+)
+@pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt csv zip")
+class TestExtractArchive:
+    def test_zip(self, zip_path):
+        members = archive.extract_archive(zip_path)
+        assert _text(members) == {
+            "readme.txt": "hello from zip",
+            "data/table.csv": "a,b\n1,2\n",
+        }
+
+    def test_tar_gz(self, tmp_path):
+        path = tmp_path / "archive.tar.gz"
+        content = b"hello from tar"
+        with tarfile.open(path, "w:gz") as dest:
+            info = tarfile.TarInfo("readme.txt")
+            info.size = len(content)
+            dest.addfile(info, io.BytesIO(content))
+
+        members = archive.extract_archive(str(path))
+        assert _text(members) == {"readme.txt": "hello from tar"}
+
+    def test_gzip(self, tmp_path):
+        path = tmp_path / "file.gz"
+        with gzip.open(path, "wb") as dest:
+            dest.write(b"hello from gzip")
+
+        members = archive.extract_archive(str(path))
+        assert _text(members) == {"": "hello from gzip"}
+
+    def test_members_are_streamed(self, zip_path, monkeypatch):
+        created = []
+        temporary = tempfile.NamedTemporaryFile
+
+        def track(**kwargs):
+            dest = temporary(**kwargs)
+            created.append(dest.name)
+            return dest
+
+        monkeypatch.setattr(tempfile, "NamedTemporaryFile", track)
+
+        members = archive.extract_archive(zip_path)
+        first = next(members)
+        assert len(created) == 1
+        assert os.path.exists(created[0])
+        assert "".join(first.chunks) == "hello from zip"
+
+        second = next(members)
+        assert not os.path.exists(created[0])
+        assert "".join(second.chunks) == "a,b\n1,2\n"
+
+        assert list(members) == []
+        assert not any(map(os.path.exists, created))
+
+    @pytest.mark.ckan_config(config.CONFIG_ARCHIVE_MAX_MEMBERS, 1)
+    def test_member_limit(self, zip_path):
+        members = archive.extract_archive(zip_path)
+        assert _text(members) == {"readme.txt": "hello from zip"}
+
+    @pytest.mark.ckan_config(config.CONFIG_ARCHIVE_MAX_RATIO, 2)
+    def test_ratio_limit(self, tmp_path):
+        path = tmp_path / "bomb.zip"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dest:
+            dest.writestr("zeros.txt", b"0" * 1024**2)
+
+        with pytest.raises(exc.ArchiveLimitError):
+            _text(archive.extract_archive(str(path)))
+
+    @pytest.mark.ckan_config(config.CONFIG_ARCHIVE_MAX_RATIO, 2)
+    def test_members_before_limit_remain(self, tmp_path):
+        path = tmp_path / "bomb.zip"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dest:
+            dest.writestr("first.txt", "first member")
+            dest.writestr("zeros.txt", b"0" * 1024**2)
+
+        pkg_dict = {"id": "pkg"}
+        with pytest.raises(exc.ArchiveLimitError):
+            archive.merge_archive(
+                pkg_dict, archive.extract_archive(str(path))
+            )
+        assert pkg_dict["text"] == ["first member"]
+
+
+@pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt csv zip")
+@pytest.mark.ckan_config("ckanext.resource_indexer.sniff_content", "false")
+@pytest.mark.ckan_config("ckanext.resource_indexer.stats.enabled", "true")
+@pytest.mark.ckan_config("ckanext.resource_indexer.stats.skip_empty", "true")
+class TestStats:
+    @pytest.fixture(autouse=True)
+    def handlers(self, monkeypatch, tmp_path, ckan_config):
+        from ckanext.resource_indexer import plugin, utils
+
+        monkeypatch.setitem(
+            ckan_config,
+            "ckanext.resource_indexer.metrics_path",
+            str(tmp_path / "metrics.db"),
+        )
+        handlers = [
+            plugin.PlainResourceIndexerPlugin(),
+            plugin.ArchiveResourceIndexerPlugin(),
+        ]
+        monkeypatch.setattr(
+            utils,
+            "_get_handlers",
+            lambda res: [
+                h for h in handlers if h.get_resource_indexer_weight(res)
+            ],
+        )
+
+    def _index(self, path):
+        from ckanext.resource_indexer import utils
+
+        pkg_dict = {"id": "pkg"}
+        with utils.ResourceFile(path) as file:
+            utils._index_file({"id": "res", "format": "zip"}, file, pkg_dict)
+        return pkg_dict
+
+    def test_archive_is_not_empty(self, zip_path):
+        from ckanext.resource_indexer import utils
+
+        expected = ["hello from zip", "a,b\n1,2\n"]
+        assert self._index(zip_path)["text"] == expected
+        assert self._index(zip_path)["text"] == expected
+
+        [row] = utils.get_stats_store().stats_summary()
+        assert row["empty"] == 0
+        assert row["chars"] == len("".join(expected))
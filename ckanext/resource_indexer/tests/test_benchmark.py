@@ -0,0 +1,27 @@
+"""Tests for benchmark.py."""
+
+from ckanext.resource_indexer import benchmark
+
+
+def test_plugin_import_is_lazy():
+    """Optional dependencies are not loaded together with the plugin."""
+    profile = benchmark.profile_import()
+    assert "ckanext.resource_indexer.plugin" in profile.modules
+    assert profile.heavy == []
+
+
+def test_heavy_modules_are_detected():
+    profile = benchmark.profile_import(
+        "ckanext.resource_indexer.work_queue", baseline=()
+    )
+    assert "ckanext.resource_indexer.work_queue" in profile.heavy
+
+
+def test_cli_import_is_lazy():
+    """CLI module is loaded for every ckan command."""
+    profile = benchmark.profile_import("ckanext.resource_indexer.cli")
+    assert not {
+        "sqlite3",
+        "ckanext.resource_indexer.metrics",
+        "ckanext.resource_indexer.work_queue",
+    } & set(profile.modules)
@@ -0,0 +1,65 @@
+"""Tests for cli.py."""
+
+import pytest
+from click.testing import CliRunner
+
+from ckanext.resource_indexer import cli, config, work_queue
+
+
+class _Indexer:
+    def __init__(self):
+        self.ids = []
+
+    def __call__(self, id_: str) -> bool:
+        self.ids.append(id_)
+        if id_ == "broken":
+            raise ValueError(id_)
+        return True
+
+
+@pytest.fixture
+def indexer(monkeypatch):
+    indexer = _Indexer()
+    monkeypatch.setattr(cli, "_Indexer", lambda: indexer)
+    return indexer
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(work_queue, "_memory_queue", None)
+    return work_queue.get_queue()
+
+
+def _invoke(*args: str):
+    return CliRunner().invoke(cli.resource_indexer, args)
+
+
+@pytest.mark.ckan_config(config.CONFIG_QUEUE_URL, "memory://")
+@pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt")
+class TestWorker:
+    def test_queue_processed(self, indexer, queue):
+        result = _invoke("rebuild", "--enqueue", "a", "broken", "b")
+        assert result.exit_code == 0, result.output
+        assert queue.stats() == {"pending": 3, "claimed": 0}
+
+        result = _invoke("worker", "--burst", "-b", "2", "-n", "test")
+        assert result.exit_code == 0, result.output
+        assert "Worker test processed 3 packages" in result.output
+
+        # failed packages are acknowledged as well
+        assert indexer.ids == ["a", "broken", "b"]
+        assert queue.stats() == {"pending": 0, "claimed": 0}
+
+    def test_deferred_packages_processed_last(self, indexer, queue):
+        queue.enqueue(["deferred"], priority=-1)
+        queue.enqueue(["a", "b"])
+
+        result = _invoke("worker", "--burst")
+        assert result.exit_code == 0, result.output
+        assert indexer.ids == ["a", "b", "deferred"]
+
+    def test_formats_cannot_be_enqueued(self, indexer, queue):
+        result = _invoke("rebuild", "--enqueue", "-f", "pdf", "a")
+        assert result.exit_code == 2
+        assert "cannot be combined with --enqueue" in result.output
+        assert queue.stats() == {"pending": 0, "claimed": 0}
@@ -0,0 +1,151 @@
+"""Load tests that use fake Solr and remote servers from harness.py."""
+
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from ckanext.resource_indexer import config, hosts
+
+from . import harness
+
+
+@pytest.fixture
+def remote():
+    with harness.RemoteServer() as server:
+        yield server
+
+
+@pytest.fixture
+def solr():
+    with harness.FakeSolr() as server:
+        yield server
+
+
+class TestRemoteServer:
+    def test_latency_and_failures(self, remote):
+        url = remote.add("file.txt", b"hello", latency=0.1, failures=1)
+
+        start = time.perf_counter()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(url)
+        assert e.value.code == 503
+        assert time.perf_counter() - start >= 0.1
+
+        with urllib.request.urlopen(url) as resp:
+            assert resp.read() == b"hello"
+        assert remote.hits["/file.txt"] == 2
+
+    def test_chunked_large_body(self, remote):
+        url = remote.add("big.txt", b"abc", size=1000, chunked=True)
+        with urllib.request.urlopen(url) as resp:
+            assert resp.headers["transfer-encoding"] == "chunked"
+            body = resp.read()
+
+        assert len(body) == 1000
+        assert body == (b"abc" * 334)[:1000]
+
+
+class TestFakeSolr:
+    def _post(self, solr, body: bytes, content_type: str):
+        req = urllib.request.Request(
+            solr.url + "/update?commit=true",
+            data=body,
+            headers={"Content-Type": content_type},
+        )
+        urllib.request.urlopen(req).close()
+
+    def test_xml_and_json_updates(self, solr):
+        self._post(
+            solr,
+            b'<add><doc><field name="index_id">1</field>'
+            b'<field name="text">a</field><field name="text">b</field>'
+            b"</doc></add>",
+            "text/xml",
+        )
+        self._post(
+            solr,
+            json.dumps([{"index_id": "1", "extra": {"set": "x"}}]).encode(),
+            "application/json",
+        )
+
+        assert solr.added == 2
+        assert solr.documents["1"] == {
+            "index_id": "1",
+            "text": ["a", "b"],
+            "extra": "x",
+        }
+
+
+@pytest.mark.usefixtures("with_plugins")
+@pytest.mark.ckan_config(
+    "ckan.plugins", "resource_indexer plain_resource_indexer"
+)
+@pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt")
+@pytest.mark.ckan_config(config.CONFIG_ALLOW_REMOTE, "true")
+@pytest.mark.ckan_config(config.CONFIG_SNIFF_CONTENT, "false")
+class TestLoad:
+    def test_index_packages(self, remote):
+        remote.add("fast.txt", b"fast content")
+        remote.add("slow.txt", b"slow content", latency=0.01)
+        remote.add("stream.txt", b"chunked content", chunked=True)
+        paths = ["fast.txt", "slow.txt", "stream.txt"]
+
+        results = []
+        report = harness.index_packages(
+            harness.make_packages(
+                300, 3, lambda pkg, res: f"{remote.base_url}/{paths[res]}"
+            ),
+            results,
+        )
+
+        assert report.packages == 300
+        assert report.resources == 900
+        assert report.throughput > 0
+        assert sum(remote.hits.values()) == 900
+        assert all(
+            pkg["text"] == ["fast content", "slow content", "chunked content"]
+            for pkg in results
+        )
+
+    def test_failing_host_is_skipped(self, remote):
+        url = remote.add("broken.txt", failures=1000)
+        threshold = config.host_failure_threshold()
+
+        report = harness.index_packages(
+            harness.make_packages(50, 1, lambda pkg, res: url)
+        )
+
+        assert report.packages == 50
+        assert remote.hits["/broken.txt"] == threshold
+        host = remote.base_url.split("//")[1]
+        assert hosts.get_registry().report()[host] == 50 - threshold
+
+    @pytest.mark.ckan_config(config.CONFIG_MAX_REMOTE_SIZE, "1")
+    def test_memory_does_not_depend_on_file_size(self, remote):
+        url = remote.add(
+            "huge.txt", b"data ", size=10 * 1024**2, chunked=True
+        )
+
+        report = harness.index_packages(
+            harness.make_packages(5, 1, lambda pkg, res: url)
+        )
+
+        # download stops as soon as max_remote_size is reached
+        assert report.peak_memory < 1024**2
+
+    @pytest.mark.usefixtures("clean_db")
+    def test_rebuild(self, remote, solr):
+        url = remote.add("file.txt", b"rebuild content")
+        ids = harness.create_packages(20, 2, lambda pkg, res: url)
+
+        with solr.patched():
+            report = harness.rebuild_packages(ids)
+
+        assert report.packages == 20
+        assert report.resources == 40
+        docs = [doc for doc in solr.documents.values() if doc["id"] in ids]
+        assert len(docs) == 20
+        assert all("rebuild content" in doc["text"] for doc in docs)
@@ -0,0 +1,104 @@
+"""Tests for hosts.py."""
+
+import pytest
+
+from ckanext.resource_indexer import exc, hosts
+
+URL = "http://example.com/file.csv"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def registry(clock):
+    settings = hosts.HostSettings(
+        failure_threshold=2,
+        cooldown=60,
+        max_concurrency=2,
+        min_interval=0,
+        wait_timeout=0,
+    )
+    return hosts.HostRegistry(settings, clock)
+
+
+def _fail(registry, retry_after=None):
+    with registry.slot(URL) as slot:
+        slot.failure(retry_after)
+
+
+class TestHostRegistry:
+    def test_circuit_opens_after_repeated_failures(self, registry, clock):
+        _fail(registry)
+        clock.now += 1
+        _fail(registry)
+
+        with pytest.raises(exc.HostUnavailableError):
+            with registry.slot(URL):
+                pass
+
+        with registry.slot("http://other.com/file.csv"):
+            pass
+
+        assert registry.report() == {"example.com": 1}
+
+    def test_single_trial_request_after_cooldown(self, registry, clock):
+        _fail(registry)
+        clock.now += 1
+        _fail(registry)
+        clock.now += 61
+
+        with registry.slot(URL):
+            with pytest.raises(exc.HostUnavailableError):
+                with registry.slot(URL):
+                    pass
+
+        clock.now += 1
+        with registry.slot(URL):
+            pass
+
+    def test_retry_after_skips_host(self, registry, clock):
+        _fail(registry, retry_after=10)
+        with pytest.raises(exc.HostUnavailableError):
+            with registry.slot(URL):
+                pass
+
+        clock.now += 11
+        with registry.slot(URL):
+            pass
+
+    def test_exception_is_not_success(self, registry):
+        _fail(registry)
+        limit = registry.hosts["example.com"].limit
+
+        with pytest.raises(ValueError):
+            with registry.slot(URL):
+                raise ValueError()
+
+        state = registry.hosts["example.com"]
+        assert state.failures == 1
+        assert state.limit == limit
+        assert state.active == 0
+
+    def test_concurrency_is_limited(self, registry):
+        with registry.slot(URL), registry.slot(URL):
+            with pytest.raises(exc.HostUnavailableError):
+                with registry.slot(URL):
+                    pass
+
+
+@pytest.mark.parametrize(
+    "value, expected", [(None, None), ("", None), ("12", 12.0), ("soon", None)]
+)
+def test_parse_retry_after(value, expected):
+    assert hosts.parse_retry_after(value) == expected
@@ -0,0 +1,93 @@
+"""Tests for markup.py."""
+
+import pytest
+
+from ckanext.resource_indexer import config, exc, markup, utils
+
+
+def _extract(tmp_path, content: bytes, fmt: str) -> str:
+    path = tmp_path / f"document.{fmt}"
+    path.write_bytes(content)
+
+    token = utils.current_resource.set({"id": "res", "format": fmt})
+    try:
+        with utils.ResourceFile(str(path)) as file:
+            return " ".join("".join(markup.extract_markup(file)).split())
+    finally:
+        utils.current_resource.reset(token)
+
+
+class TestHtml:
+    def test_visible_text(self, tmp_path):
+        content = b"""
+        <html><head><title>Terms &amp; conditions</title>
+        <style>body { color: red }</style>
+        <script>var tag = "<p>hidden</p>";</script></head>
+        <body><h1>Head<b>ing</b></h1><p>First<br>second</p>
+        <img src="a.png" alt="picture" data-id="1">
+        <noscript><p>enable js</p></noscript>
+        <template><div>unclosed</template>
+        <p>tail</p></body></html>
+        """
+        assert (
+            _extract(tmp_path, content, "html")
+            == "Terms & conditions Heading First second picture tail"
+        )
+
+    def test_words_around_elements_are_separated(self, tmp_path):
+        content = b"<div>one<br>two<style>x</style>three <b>fo</b>ur</div>"
+        assert _extract(tmp_path, content, "html") == "one two three four"
+
+    def test_buffer_is_not_loaded(self, tmp_path):
+        path = tmp_path / "document.html"
+        path.write_bytes(b"<p>hello</p>")
+
+        with utils.ResourceFile(str(path), use_mmap=False) as file:
+            assert "".join(markup.extract_markup(file)).split() == ["hello"]
+            assert file._buffer is None
+
+    @pytest.mark.ckan_config(config.CONFIG_MARKUP_ATTRIBUTES, "data-id")
+    @pytest.mark.ckan_config(config.CONFIG_MARKUP_SKIP_TAGS, "h1")
+    def test_configurable(self, tmp_path):
+        content = b'<h1>skip</h1><img alt="picture" data-id="42"><p>text</p>'
+        assert _extract(tmp_path, content, "html") == "42 text"
+
+    def test_large_document(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(markup, "CHUNK_SIZE", 16)
+        content = b"<p>" + b"word " * 100 + b"</p>" + b"<i>x</i>" * 10
+        path = tmp_path / "document.html"
+        path.write_bytes(content)
+
+        with utils.ResourceFile(str(path)) as file:
+            chunks = list(markup.extract_markup(file))
+
+        assert len(chunks) > 1
+        assert "".join(chunks).split() == ["word"] * 100 + ["x" * 10]
+
+
+class TestXml:
+    def test_text_and_attributes(self, tmp_path):
+        content = b"""<?xml version="1.0"?>
+        <root xmlns:dc="http://purl.org/dc/elements/1.1/">
+        <dc:title>AT&amp;T</dc:title>
+        <item title="attribute">value<sub>nested</sub></item>
+        <script>skipped</script>
+        </root>
+        """
+        assert (
+            _extract(tmp_path, content, "xml")
+            == "AT&T attribute value nested"
+        )
+
+    def test_external_entities_ignored(self, tmp_path):
+        secret = tmp_path / "secret.txt"
+        secret.write_text("secret")
+        content = (
+            f'<?xml version="1.0"?><!DOCTYPE r ['
+            f'<!ENTITY e SYSTEM "file://{secret}">]><r>&e;public</r>'
+        ).encode()
+        assert _extract(tmp_path, content, "xml") == "public"
+
+    def test_malformed(self, tmp_path):
+        with pytest.raises(exc.UnexpectedContentError):
+            _extract(tmp_path, b"<root><a></root>", "xml")
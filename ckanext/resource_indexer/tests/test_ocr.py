@@ -0,0 +1,90 @@
+"""Tests for ocr.py."""
+
+import os
+import stat
+
+import pytest
+
+from ckanext.resource_indexer import config, ocr, utils
+
+pytest.importorskip("pdftotext")
+
+PDF = os.path.join(os.path.dirname(__file__), "data/example.pdf")
+
+
+def _script(path, body: str) -> str:
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@pytest.fixture
+def ocr_tools(tmp_path, ckan_config, monkeypatch):
+    """Stub binaries: rasterizer renders page number, OCR echoes it back."""
+    calls = tmp_path / "calls"
+    pdftoppm = _script(
+        tmp_path / "pdftoppm",
+        f'echo raster >> {calls}\n'
+        'for last; do :; done\necho "page $2" > "$last.png"\n',
+    )
+    tesseract = _script(
+        tmp_path / "tesseract",
+        f'echo call >> {calls}\nprintf "recognised "; cat\n',
+    )
+    monkeypatch.setitem(ckan_config, config.CONFIG_OCR_PDFTOPPM, pdftoppm)
+    monkeypatch.setitem(ckan_config, config.CONFIG_OCR_TESSERACT, tesseract)
+    monkeypatch.setitem(
+        ckan_config, config.CONFIG_OCR_CACHE_DIR, str(tmp_path / "cache")
+    )
+    return calls
+
+
+@pytest.mark.usefixtures("ocr_tools")
+class TestExtractPdfWithOcr:
+    def test_pages_with_text_are_not_recognised(self):
+        content = "".join(ocr.extract_pdf_with_ocr(PDF))
+        assert "Dummy PDF" in content
+        assert "recognised" not in content
+
+    @pytest.mark.ckan_config(config.CONFIG_OCR_MIN_CHARS, 1000)
+    @pytest.mark.ckan_config(config.CONFIG_OCR_WORKERS, 1)
+    def test_empty_pages_are_recognised(self):
+        content = "".join(ocr.extract_pdf_with_ocr(PDF))
+        assert content.strip() == "recognised page 1"
+
+    @pytest.mark.ckan_config(config.CONFIG_OCR_PAGE_BUDGET, 2)
+    def test_budget_limits_recognised_pages(self, monkeypatch):
+        monkeypatch.setattr(utils, "read_pdf_pages", lambda path: ["", "", ""])
+        content = [p.strip() for p in ocr.extract_pdf_with_ocr(PDF)]
+        assert content == ["recognised page 1", "recognised page 2", ""]
+
+    @pytest.mark.ckan_config(config.CONFIG_OCR_MIN_CHARS, 1000)
+    def test_results_are_cached(self, ocr_tools):
+        list(ocr.extract_pdf_with_ocr(PDF))
+        list(ocr.extract_pdf_with_ocr(PDF))
+        # cached pages are not even rasterized
+        assert ocr_tools.read_text().split() == ["raster", "call"]
+
+    @pytest.mark.ckan_config(config.CONFIG_OCR_MIN_CHARS, 1000)
+    def test_cache_depends_on_settings(self, ocr_tools, ckan_config):
+        list(ocr.extract_pdf_with_ocr(PDF))
+        ckan_config[config.CONFIG_OCR_DPI] = 100
+        list(ocr.extract_pdf_with_ocr(PDF))
+        assert ocr_tools.read_text().count("call") == 2
+
+    @pytest.mark.ckan_config(config.CONFIG_OCR_MIN_CHARS, 1000)
+    def test_known_digest_is_used(self, ocr_tools, monkeypatch):
+        from ckanext.resource_indexer.plugin import (
+            OcrPdfResourceIndexerPlugin,
+        )
+
+        def rehash(path):
+            raise AssertionError("file is hashed again")
+
+        monkeypatch.setattr(ocr, "_file_digest", rehash)
+        plugin = OcrPdfResourceIndexerPlugin()
+        with utils.ResourceFile(PDF) as file:
+            list(utils.extract_chunks(plugin, file))
+            list(utils.extract_chunks(plugin, file))
+
+        assert ocr_tools.read_text().split() == ["raster", "call"]
@@ -9,7 +9,9 @@ import pysolr
 import ckan.tests.helpers as helpers
 from ckan.lib.search import rebuild
 
-from ckanext.resource_indexer import config
+from ckanext.resource_indexer import config, utils
+
+from . import harness
 
 
 def dumb_translator(string: str):
@@ -107,6 +109,53 @@ class TestPlainIndexer(object):
         result = helpers.call_action("package_search", q="newer will be here")
         assert result["count"] == 0
 
+    @pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt")
+    @pytest.mark.ckan_config(
+        config.CONFIG_FORMAT_FIELD_PREFIX, "extras_res_text_"
+    )
+    def test_content_stored_in_format_field(self, create_with_upload, package):
+        create_with_upload(
+            "hello world", "file.txt", format="txt", package_id=package["id"]
+        )
+        result = helpers.call_action(
+            "package_search", q="extras_res_text_txt:hello"
+        )
+        assert result["count"] == 1
+
+    @pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "pdf txt")
+    def test_mislabeled_resource_is_rerouted(self, create_with_upload, package):
+        create_with_upload(
+            "hello world", "file.pdf", format="pdf", package_id=package["id"]
+        )
+        result = helpers.call_action("package_search", q="hello world")
+        assert result["count"] == 1
+
+    @pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "pdf")
+    @pytest.mark.ckan_config(config.CONFIG_PLAIN_FORMATS, "pdf")
+    def test_mislabeled_resource_is_skipped(self, create_with_upload, package):
+        create_with_upload(
+            "hello world", "file.pdf", format="pdf", package_id=package["id"]
+        )
+        result = helpers.call_action("package_search", q="hello world")
+        assert result["count"] == 0
+
+    @pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt")
+    @pytest.mark.ckan_config(config.CONFIG_CONTENT_MODE, "field")
+    def test_content_stored_in_resource_field(
+        self, create_with_upload, package
+    ):
+        res = create_with_upload(
+            "hello world", "file.txt", format="txt", package_id=package["id"]
+        )
+        field = utils.get_resource_field(res["id"])
+        assert field == "extras_res_content_" + res["id"].replace("-", "_")
+
+        result = helpers.call_action("package_search", q=f"{field}:hello")
+        assert result["count"] == 1
+
+        result = helpers.call_action("package_search", q="hello world")
+        assert result["count"] == 1
+
 
 @pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
 @pytest.mark.ckan_config(
@@ -169,6 +218,19 @@ class TestBoost:
         helpers.call_action("package_search", q="hello", qf="name^1")
         assert fn.call_args.kwargs["qf"] == "name^1 custom_field^2"
 
+    @pytest.mark.ckan_config(
+        config.CONFIG_FORMAT_FIELD_PREFIX, "extras_res_text_"
+    )
+    @pytest.mark.ckan_config(config.CONFIG_FORMAT_BOOST, "pdf:3 csv:0.5 txt:1")
+    def test_boosted_format_fields(self, monkeypatch):
+        fn = mock.MagicMock()
+        monkeypatch.setattr(pysolr.Solr, "search", fn)
+        helpers.call_action("package_search", q="hello")
+        assert (
+            fn.call_args.kwargs["qf"]
+            == QUERY_FIELDS + " extras_res_text_pdf^3 extras_res_text_csv^0.5"
+        )
+
 
 @pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
 @pytest.mark.ckan_config(
@@ -202,3 +264,119 @@ class TestJsonIndexer(object):
 
         result = helpers.call_action("package_search", q="hello world")
         assert result["count"] == 0
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+@pytest.mark.ckan_config(
+    "ckan.plugins", "resource_indexer plain_resource_indexer"
+)
+@pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "txt")
+@pytest.mark.ckan_config(config.CONFIG_CONTENT_MODE, "field")
+@pytest.mark.ckan_config(config.CONFIG_ATOMIC_UPDATES, "true")
+class TestAtomicUpdates:
+    def _atomic(self, solr, field):
+        return [
+            doc[field]
+            for payload in solr.payloads
+            for doc in payload.add
+            if isinstance(doc.get(field), dict)
+        ]
+
+    def test_resource_field_updated(self, create_with_upload, package):
+        with harness.FakeSolr() as solr, solr.patched():
+            res = create_with_upload(
+                "hello world",
+                "file.txt",
+                format="txt",
+                package_id=package["id"],
+            )
+            field = utils.get_resource_field(res["id"])
+            assert self._atomic(solr, field) == [{"set": "hello world"}]
+
+            helpers.call_action("resource_delete", id=res["id"])
+            assert self._atomic(solr, field)[-1] == {"set": ""}
+
+    def test_package_hooks_are_ignored(self, package, resource):
+        from ckanext.resource_indexer.plugin import ResourceIndexerPlugin
+
+        plugin = ResourceIndexerPlugin()
+        with mock.patch.object(utils, "update_resource_field") as update:
+            plugin.after_create({}, package)
+            plugin.after_update({}, package)
+            plugin.after_delete({}, package)
+            assert not update.called
+
+            plugin.after_update({}, resource)
+            update.assert_called_once_with(resource)
+
+    @pytest.mark.ckan_config(config.CONFIG_CACHE_CONTENT, "true")
+    def test_content_extracted_once_per_version(
+        self, create_with_upload, package, ckan_config, monkeypatch, tmp_path
+    ):
+        monkeypatch.setitem(
+            ckan_config, config.CONFIG_METRICS_PATH, str(tmp_path / "m.db")
+        )
+        with harness.FakeSolr() as solr, solr.patched(), mock.patch.object(
+            utils, "extract_chunks", wraps=utils.extract_chunks
+        ) as extract:
+            res = create_with_upload(
+                "hello world",
+                "file.txt",
+                format="txt",
+                package_id=package["id"],
+            )
+            assert extract.call_count == 1
+
+            helpers.call_action(
+                "resource_patch", id=res["id"], description="changed"
+            )
+            assert extract.call_count == 1
+
+            create_with_upload(
+                "new content",
+                "file.txt",
+                action="resource_update",
+                id=res["id"],
+            )
+            assert extract.call_count == 2
+
+            field = utils.get_resource_field(res["id"])
+            assert self._atomic(solr, field)[-1] == {"set": "new content"}
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+@pytest.mark.ckan_config(
+    "ckan.plugins", "resource_indexer plain_resource_indexer"
+)
+@pytest.mark.ckan_config(config.CONFIG_CONTENT_MODE, "child")
+class TestChildDocuments:
+    def test_children_removed_with_package(self, package):
+        with harness.FakeSolr() as solr, solr.patched():
+            helpers.call_action("package_delete", id=package["id"])
+
+        query = "_root_:{} AND entity_type:resource".format(
+            utils.get_index_id(package["id"])
+        )
+        assert any(query in payload.delete for payload in solr.payloads)
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+@pytest.mark.ckan_config(
+    "ckan.plugins",
+    "resource_indexer plain_resource_indexer markup_resource_indexer",
+)
+@pytest.mark.ckan_config(config.CONFIG_INDEXABLE_FORMATS, "html")
+class TestMarkupIndexer:
+    def test_markup_is_stripped(self, create_with_upload, package):
+        create_with_upload(
+            "<p>visible paragraph</p><script>hiddenscript()</script>",
+            "file.html",
+            format="html",
+            package_id=package["id"],
+        )
+
+        result = helpers.call_action("package_search", q="visible paragraph")
+        assert result["count"] == 1
+
+        result = helpers.call_action("package_search", q="hiddenscript")
+        assert result["count"] == 0
@@ -0,0 +1,90 @@
+"""Tests for schedule.py and metrics.py."""
+
+import pytest
+
+from ckanext.resource_indexer import metrics, schedule
+
+
+class TestEstimate:
+    @pytest.mark.ckan_config(
+        "ckanext.resource_indexer.format_cost", "pdf:2 *:0.5"
+    )
+    def test_format_and_size(self):
+        pdf = schedule.estimate_resource(
+            {"format": "PDF", "size": 10 * 1024**2, "url_type": "upload"}
+        )
+        txt = schedule.estimate_resource(
+            {"format": "txt", "size": 10 * 1024**2, "url_type": "upload"}
+        )
+        assert pdf == pytest.approx(schedule.RESOURCE_COST + 20)
+        assert txt == pytest.approx(schedule.RESOURCE_COST + 5)
+
+    @pytest.mark.ckan_config("ckanext.resource_indexer.format_cost", "*:1")
+    def test_remote_and_unknown_size(self):
+        cost = schedule.estimate_resource({"format": "csv", "size": None})
+        expected = (
+            schedule.RESOURCE_COST
+            + schedule.DEFAULT_SIZE
+            + schedule.REMOTE_COST
+        )
+        assert cost == pytest.approx(expected)
+
+
+class TestOrder:
+    costs = {"a": 1, "b": 10, "c": 5}
+
+    def test_order(self):
+        ids = ["a", "b", "c"]
+        assert schedule.order(ids, self.costs, schedule.Order.none) == ids
+        assert schedule.order(ids, self.costs, schedule.Order.longest) == [
+            "b",
+            "c",
+            "a",
+        ]
+        assert schedule.order(ids, self.costs, schedule.Order.cheapest) == [
+            "a",
+            "c",
+            "b",
+        ]
+
+    def test_split_expensive(self):
+        ids = ["a", "b", "c"]
+        assert schedule.split_expensive(ids, self.costs, None) == (ids, [])
+        assert schedule.split_expensive(ids, self.costs, 5) == (
+            ["a", "c"],
+            ["b"],
+        )
+
+
+class TestPartition:
+    def test_every_package_assigned_once(self):
+        ids = [f"pkg-{idx}" for idx in range(1000)]
+        bins = schedule.partition(ids, 3)
+
+        assert sorted(id_ for bin_ in bins for id_ in bin_) == sorted(ids)
+        assert all(250 < len(bin_) < 420 for bin_ in bins)
+
+    def test_independent_of_other_packages(self):
+        ids = [f"pkg-{idx}" for idx in range(100)]
+        bins = schedule.partition(ids, 3)
+        shuffled = schedule.partition(["new", *reversed(ids[10:])], 3)
+
+        for before, after in zip(bins, shuffled):
+            assert set(before) - set(ids[:10]) == set(after) - {"new"}
+
+    def test_more_workers_than_packages(self):
+        bins = schedule.partition(["a"], 3)
+        assert sorted(bins) == [[], [], ["a"]]
+
+
+class TestMetricsStore:
+    def test_durations(self, tmp_path):
+        store = metrics.MetricsStore(str(tmp_path / "metrics.db"))
+        store.record_package("a", 1.5)
+        store.record_package("b", 2)
+        store.record_package("a", 3)
+
+        assert store.package_durations(["a", "b", "c"]) == {"a": 3, "b": 2}
+
+    def test_disabled_by_default(self):
+        assert metrics.get_store() is None
@@ -0,0 +1,38 @@
+"""Tests for sniff.py."""
+
+import pytest
+
+from ckanext.resource_indexer import sniff
+
+
+@pytest.fixture
+def write(tmp_path):
+    def writer(content: bytes):
+        path = tmp_path / "file"
+        path.write_bytes(content)
+        return str(path)
+
+    return writer
+
+
+class TestSniff:
+    def test_html_is_not_pdf(self, write):
+        detected = sniff.sniff(write(b"<html><body>Not found</body></html>"))
+        assert detected.mimetype == "text/html"
+        assert not detected.is_compatible("pdf")
+        assert detected.is_compatible("html")
+        assert detected.format == "html"
+
+    def test_unknown_formats_are_compatible(self, write):
+        detected = sniff.sniff(write(b"<html><body>Not found</body></html>"))
+        assert detected.is_compatible("docx")
+
+    def test_empty(self, write):
+        assert sniff.sniff(write(b"")).empty
+
+    def test_result_is_refreshed_when_file_changes(self, write):
+        path = write(b"hello world")
+        assert sniff.sniff(path).format == "txt"
+
+        write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n" + b" " * 100)
+        assert sniff.sniff(path).format == "pdf"
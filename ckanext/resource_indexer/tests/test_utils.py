@@ -1,6 +1,10 @@
+import os
+
 import pytest
 from ckanext.resource_indexer import utils
 
+from . import harness
+
 
 @pytest.fixture
 def resources():
@@ -16,3 +20,367 @@ def test_case_insensitive_indexable(resources):
     indexable = utils.select_indexable_resources(resources)
     formats = {r["format"] for r in indexable}
     assert formats == {"pdf", "PDF"}
+
+
+class TestContentCapture:
+    def test_disabled_by_default(self):
+        pkg_dict = {"id": "pkg"}
+        utils.merge_text_chunks(pkg_dict, ["hello"])
+        assert utils.debug_capture.get() is None
+
+    def test_window_of_multivalued_field(self):
+        pkg_dict = {"id": "pkg", "text": ["title"]}
+        with utils.capture_content() as capture:
+            utils.merge_text_chunks(pkg_dict, ["hello ", "world"])
+            utils.merge_text_chunks(pkg_dict, ["second"])
+
+        assert capture.window(0, 100) == "title hello world second"
+        assert capture.window(8, 21) == "llo world sec"
+        assert [f[:2] for f in capture.fragments] == [(6, 17), (18, 24)]
+        assert capture.resource_at(0) is None
+
+    def test_deprecated_last_content(self):
+        pkg_dict = {"id": "pkg", "text": ["title"]}
+        with utils.capture_content():
+            utils.merge_text_chunks(pkg_dict, ["hello"])
+            with pytest.deprecated_call():
+                assert utils.debug_last_content.get() == "title hello"
+
+        with pytest.deprecated_call():
+            assert utils.debug_last_content.get() == ""
+
+
+@pytest.mark.ckan_config(
+    "ckanext.resource_indexer.format_field_prefix", "extras_res_text_"
+)
+class TestContentMode:
+    def _merge(self, pkg_dict, res, chunks):
+        token = utils.current_resource.set(res)
+        try:
+            return utils.merge_text_chunks(pkg_dict, chunks)
+        finally:
+            utils.current_resource.reset(token)
+
+    @pytest.mark.ckan_config("ckanext.resource_indexer.content_mode", "field")
+    def test_field(self):
+        pkg_dict = {"id": "pkg"}
+        res = {"id": "res-1", "format": "TXT"}
+        self._merge(pkg_dict, res, ["hello ", "world"])
+        self._merge(pkg_dict, dict(res, id="res-2"), ["second"])
+
+        assert pkg_dict == {
+            "id": "pkg",
+            "extras_res_content_res_1": "hello world",
+            "extras_res_content_res_2": "second",
+            "extras_res_text_txt": "hello world second",
+        }
+
+    @pytest.mark.ckan_config("ckanext.resource_indexer.content_mode", "child")
+    def test_child(self):
+        pkg_dict = {"id": "pkg"}
+        res = {"id": "res", "format": "txt"}
+        self._merge(pkg_dict, res, ["hello ", "world"])
+        self._merge(pkg_dict, res, ["again"])
+
+        assert "text" not in pkg_dict
+        [child] = pkg_dict["_childDocuments_"]
+        assert child["id"] == "res"
+        assert child["package_id"] == "pkg"
+        assert child["entity_type"] == "resource"
+        assert child["index_id"] == utils.get_index_id("pkg/res")
+        assert child["text"] == ["hello world", "again"]
+        assert child["extras_res_text_txt"] == "hello world again"
+
+
+class TestResourceFile:
+    def test_content_is_mapped(self, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"hello world")
+
+        with utils.ResourceFile(str(path)) as file:
+            assert bytes(file.head(5)) == b"hello"
+            assert list(utils.extract_plain_buffer(file)) == ["hello world"]
+            assert file.digest() == (
+                "b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9"
+            )
+
+    def test_buffered_file(self, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"hello world")
+
+        with utils.ResourceFile(str(path), use_mmap=False) as file:
+            assert bytes(file.head(5)) == b"hello"
+            assert file._buffer is None
+
+            assert file.digest() == (
+                "b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9"
+            )
+            # digest loads the content, that is reused by extraction
+            assert bytes(file._buffer) == b"hello world"
+            assert bytes(file.buffer) == b"hello world"
+
+            # copy in memory does not depend on the file anymore
+            path.write_bytes(b"")
+            assert bytes(file.buffer) == b"hello world"
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"")
+
+        with utils.ResourceFile(str(path)) as file:
+            assert bytes(file.buffer) == b""
+            assert file.sniff().empty
+
+
+@pytest.mark.ckan_config("ckanext.resource_indexer.max_remote_size", "1")
+class TestRemoteDownload:
+    @pytest.fixture
+    def remote(self):
+        with harness.RemoteServer() as server:
+            yield server
+
+    def test_chunked_response(self, remote):
+        url = remote.add("file.txt", b"hello", size=100_000, chunked=True)
+        path = utils._download_remote_file("res", url)
+        assert path
+        try:
+            with open(path, "rb") as src:
+                assert src.read() == (b"hello" * 20_000)
+        finally:
+            os.remove(path)
+
+    def test_chunked_response_over_limit(self, remote):
+        url = remote.add("big.txt", size=2 * 1024**2, chunked=True)
+        assert utils._download_remote_file("res", url) is None
+
+    def test_content_length_over_limit(self, remote):
+        url = remote.add("big.txt", size=2 * 1024**2)
+        assert utils._download_remote_file("res", url) is None
+        assert remote.hits["/big.txt"] == 1
+
+
+class _TextHandler:
+    def __init__(self):
+        self.calls = 0
+
+    def extract_indexable_chunks(self, path):
+        self.calls += 1
+        with open(path) as src:
+            yield from src
+
+    def merge_chunks_into_index(self, pkg_dict, chunks):
+        return utils.merge_text_chunks(pkg_dict, chunks)
+
+
+@pytest.mark.ckan_config("ckanext.resource_indexer.sniff_content", "false")
+class TestContentCache:
+    @pytest.fixture
+    def handler(self, monkeypatch):
+        handler = _TextHandler()
+        monkeypatch.setattr(utils, "_get_handlers", lambda res: [handler])
+        return handler
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        from ckanext.resource_indexer import metrics
+
+        return metrics.MetricsStore(str(tmp_path / "metrics.db"))
+
+    def test_content_reused_for_same_version(self, handler, store, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_text("hello\nworld")
+        res = {"id": "res", "format": "txt", "url": "file.txt", "size": 11}
+
+        first = {"id": "pkg"}
+        with utils.ResourceFile(str(path)) as file:
+            utils._index_file(res, file, first, store)
+
+        second = {"id": "pkg"}
+        assert utils._merge_cached(store, res, second)
+        assert second["text"] == first["text"] == ["hello\nworld"]
+        assert handler.calls == 1
+
+        assert not utils._merge_cached(store, dict(res, size=12), {})
+
+        store.drop_content(["res"])
+        assert not utils._merge_cached(store, res, {})
+
+    def test_partially_consumed_chunks_not_cached(self, store, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_text("hello\nworld")
+        res = {"id": "res", "format": "txt", "url": "file.txt"}
+
+        class FirstLine(_TextHandler):
+            def merge_chunks_into_index(self, pkg_dict, chunks):
+                return utils.merge_text_chunks(pkg_dict, [next(iter(chunks))])
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(utils, "_get_handlers", lambda res: [FirstLine()])
+            with utils.ResourceFile(str(path)) as file:
+                utils._index_file(res, file, {"id": "pkg"}, store)
+
+        assert store.get_content("res", utils.get_fingerprint(res)) is None
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.ckan_config("ckanext.resource_indexer.index_time_budget", "5")
+class TestTimeBudget:
+    @pytest.fixture
+    def clock(self):
+        return Clock()
+
+    @pytest.fixture
+    def calls(self, monkeypatch, clock):
+        from ckanext.resource_indexer import schedule
+
+        calls = {"indexed": [], "deferred": []}
+        costs = {"small": 1, "medium": 1.5, "big": 3, "huge": 100}
+
+        def index(res, pkg_dict):
+            calls["indexed"].append(res["id"])
+            clock.now += 3
+
+        def defer(package_id, resources):
+            calls["deferred"].extend(res["id"] for res in resources)
+
+        monkeypatch.setattr(utils, "index_resource", index)
+        monkeypatch.setattr(utils, "defer_indexation", defer)
+        monkeypatch.setattr(
+            schedule, "estimate_resource", lambda res: costs[res["id"]]
+        )
+        return calls
+
+    @pytest.fixture
+    def resources(self):
+        return [
+            {"id": id_, "format": "pdf"}
+            for id_ in ["huge", "big", "small", "medium"]
+        ]
+
+    def test_cheapest_first(self, calls, resources, clock):
+        utils.index_resources(resources, {"id": "pkg"}, clock)
+        assert calls == {
+            "indexed": ["small", "medium"],
+            "deferred": ["big", "huge"],
+        }
+
+    def test_cached_content_is_not_deferred(
+        self, calls, resources, clock, monkeypatch
+    ):
+        monkeypatch.setattr(utils, "get_content_cache", lambda: object())
+        monkeypatch.setattr(
+            utils,
+            "_merge_cached",
+            lambda cache, res, pkg_dict: res["id"] == "huge",
+        )
+        utils.index_resources(resources, {"id": "pkg"}, clock)
+        assert calls == {"indexed": ["small", "medium"], "deferred": ["big"]}
+
+    def test_unlimited(self, calls, resources, clock):
+        with utils.unlimited_indexation():
+            utils.index_resources(resources, {"id": "pkg"}, clock)
+        assert calls == {
+            "indexed": ["huge", "big", "small", "medium"],
+            "deferred": [],
+        }
+
+
+class TestDeferIndexation:
+    @pytest.fixture
+    def jobs(self, monkeypatch):
+        import ckan.plugins.toolkit as tk
+
+        jobs = {}
+
+        def enqueue(fn, args, title, rq_kwargs):
+            jobs[rq_kwargs["job_id"]] = args
+
+        monkeypatch.setattr(tk, "enqueue_job", enqueue)
+        monkeypatch.setattr(
+            utils, "_is_job_queued", lambda job_id: job_id in jobs
+        )
+        return jobs
+
+    def test_single_job_per_package(self, jobs):
+        utils.defer_indexation("pkg", [{"id": "a"}])
+        utils.defer_indexation("pkg", [{"id": "b"}])
+        utils.defer_indexation("other", [{"id": "c"}])
+
+        assert jobs == {
+            utils.get_job_id("pkg"): ["pkg"],
+            utils.get_job_id("other"): ["other"],
+        }
+
+
+class _ConstHandler(_TextHandler):
+    def __init__(self, name, text):
+        super().__init__()
+        self.name = name
+        self.text = text
+
+    def extract_indexable_chunks(self, path):
+        self.calls += 1
+        return [self.text] if self.text else []
+
+
+@pytest.mark.ckan_config("ckanext.resource_indexer.sniff_content", "false")
+@pytest.mark.ckan_config("ckanext.resource_indexer.stats.enabled", "true")
+class TestStats:
+    @pytest.fixture
+    def handlers(self, monkeypatch, tmp_path, ckan_config):
+        monkeypatch.setitem(
+            ckan_config,
+            "ckanext.resource_indexer.metrics_path",
+            str(tmp_path / "metrics.db"),
+        )
+        handlers = [
+            _ConstHandler("ocr", "recognised"),
+            _ConstHandler("pdf", ""),
+        ]
+        monkeypatch.setattr(utils, "_get_handlers", lambda res: handlers)
+        return handlers
+
+    def _index(self, tmp_path):
+        path = tmp_path / "file.pdf"
+        path.write_bytes(b"%PDF-1.4")
+        pkg_dict = {"id": "pkg"}
+        with utils.ResourceFile(str(path)) as file:
+            utils._index_file({"id": "res", "format": "pdf"}, file, pkg_dict)
+        return pkg_dict
+
+    def test_outcome_recorded(self, handlers, tmp_path):
+        self._index(tmp_path)
+        self._index(tmp_path)
+
+        ocr, pdf = handlers
+        assert (ocr.calls, pdf.calls) == (0, 2)
+        [row] = utils.get_stats_store().stats_summary()
+        assert row["handler"] == "pdf"
+        assert row["empty"] == 1
+
+    @pytest.mark.ckan_config(
+        "ckanext.resource_indexer.stats.reroute_empty", "true"
+    )
+    def test_reroute_empty(self, handlers, tmp_path):
+        assert not self._index(tmp_path)["text"]
+        assert self._index(tmp_path)["text"] == ["recognised"]
+
+        ocr, pdf = handlers
+        assert (ocr.calls, pdf.calls) == (1, 1)
+
+    @pytest.mark.ckan_config(
+        "ckanext.resource_indexer.stats.skip_empty", "true"
+    )
+    def test_skip_empty(self, handlers, tmp_path):
+        self._index(tmp_path)
+        self._index(tmp_path)
+
+        ocr, pdf = handlers
+        assert (ocr.calls, pdf.calls) == (0, 1)
@@ -0,0 +1,102 @@
+"""Tests for work_queue.py."""
+
+import pytest
+
+from ckanext.resource_indexer import work_queue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def _redis_queue(clock):
+    redis = pytest.importorskip("redis")
+    import ckan.plugins.toolkit as tk
+
+    url = tk.config.get("ckan.redis.url") or "redis://localhost:6379/1"
+    queue = work_queue.RedisQueue(url, clock)
+    try:
+        queue.clear()
+    except redis.ConnectionError:
+        pytest.skip(f"Redis is not available at {url}")
+    return queue
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def queue(request, clock, tmp_path):
+    if request.param == "memory":
+        yield work_queue.MemoryQueue(clock)
+
+    elif request.param == "sqlite":
+        queue = work_queue.SqlQueue(f"sqlite:///{tmp_path}/queue.db", clock)
+        queue.create_table()
+        yield queue
+
+    else:
+        queue = _redis_queue(clock)
+        yield queue
+        queue.clear()
+
+
+class TestWorkQueue:
+    def test_items_claimed_in_order(self, queue):
+        assert queue.enqueue(["a", "b", "c"]) == 3
+        assert queue.claim("w1", 2, 60) == ["a", "b"]
+        assert queue.claim("w2", 2, 60) == ["c"]
+        assert queue.claim("w3", 2, 60) == []
+        assert queue.stats() == {"pending": 0, "claimed": 3}
+
+    def test_priority(self, queue):
+        queue.enqueue(["low"], priority=-1)
+        queue.enqueue(["normal"])
+        queue.enqueue(["high"], priority=1)
+        assert queue.claim("w1", 3, 60) == ["high", "normal", "low"]
+
+    def test_order_of_large_batches(self, queue):
+        first = [f"first-{idx}" for idx in range(2000)]
+        second = [f"second-{idx}" for idx in range(2000)]
+        queue.enqueue(first, priority=-1)
+        queue.enqueue(second, priority=-1)
+
+        assert queue.claim("w1", 4000, 60) == first + second
+
+    def test_acknowledged_items_removed(self, queue):
+        queue.enqueue(["a", "b"])
+        ids = queue.claim("w1", 2, 60)
+
+        queue.ack("w2", ids)
+        assert queue.stats() == {"pending": 0, "claimed": 2}
+
+        queue.ack("w1", ids)
+        assert queue.stats() == {"pending": 0, "claimed": 0}
+
+    def test_expired_claims_released(self, queue, clock):
+        queue.enqueue(["a", "b"])
+        assert queue.claim("crashed", 1, 60) == ["a"]
+
+        clock.now += 61
+        assert queue.claim("w1", 2, 60) == ["a", "b"]
+
+        queue.ack("crashed", ["a"])
+        assert queue.stats() == {"pending": 0, "claimed": 2}
+
+    def test_clear(self, queue):
+        queue.enqueue(["a", "b"])
+        queue.claim("w1", 1, 60)
+        queue.clear()
+        assert queue.stats() == {"pending": 0, "claimed": 0}
+
+
+def test_redis_priority_is_limited(clock):
+    queue = _redis_queue(clock)
+    with pytest.raises(ValueError):
+        queue.enqueue(["a"], priority=work_queue.MAX_PRIORITY + 1)
@@ -1,26 +1,47 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+import mmap
 import os
+import re
+import sys
 import tempfile
+import time
+import warnings
 import enum
 import json
-from typing import Any, Iterable, Optional
+from typing import IO, TYPE_CHECKING, Any, Callable, Iterable, Optional
 from contextvars import ContextVar
 from contextlib import contextmanager
 
-import requests
-
 import ckan.plugins as p
-from ckan.lib.uploader import get_resource_uploader
+import ckan.plugins.toolkit as tk
+
+from . import config, exc, hosts, sniff
 
-from . import config, exc
+if TYPE_CHECKING:
+    from . import metrics
 
 
 log = logging.getLogger(__name__)
 
 bypass_flag = ContextVar("bypass_flag", default=False)
-debug_last_content = ContextVar("debug_last_content", default="")
+budget_flag = ContextVar("budget_flag", default=True)
+debug_capture: ContextVar[Optional[ContentCapture]] = ContextVar(
+    "debug_capture", default=None
+)
+current_resource: ContextVar[Optional[dict[str, Any]]] = ContextVar(
+    "current_resource", default=None
+)
+
+RE_FIELD_UNSAFE = re.compile(r"[^a-z0-9_]")
+# control characters and replacement character, produced by decoding of
+# binary data
+RE_UNPRINTABLE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\ufffd]")
+
+# resource fields that identify the version of the resource's file
+FINGERPRINT_FIELDS = ("url", "url_type", "format", "size", "last_modified")
 
 
 class Weight(enum.IntEnum):
@@ -47,8 +68,97 @@ def select_indexable_resources(
             yield res
 
 
+def index_resources(
+    resources: Iterable[dict[str, Any]],
+    pkg_dict: dict[str, Any],
+    clock: Callable[[], float] = time.monotonic,
+):
+    """Extract the data from resources and merge it into the package.
+
+    When time budget is configured, resources are indexed from the cheapest
+    to the most expensive one. Resource is indexed only if its estimated
+    cost fits into the remaining budget, otherwise it's taken from the
+    content cache or deferred to the background job, that reindexes the
+    whole package. Estimation may be wrong and indexation of the resource
+    is never interrupted, so the budget can still be exceeded by the last
+    indexed resource.
+    """
+    budget = time_budget()
+    if not budget:
+        for res in resources:
+            index_resource(res, pkg_dict)
+        return
+
+    from . import schedule
+
+    deadline = clock() + budget
+    cache = get_content_cache()
+    deferred = []
+    for res in sorted(resources, key=schedule.estimate_resource):
+        if clock() + schedule.estimate_resource(res) <= deadline:
+            index_resource(res, pkg_dict)
+        elif not (cache and _merge_cached(cache, res, pkg_dict)):
+            deferred.append(res)
+
+    if deferred:
+        defer_indexation(pkg_dict["id"], deferred)
+
+
+def defer_indexation(package_id: str, resources: list[dict[str, Any]]):
+    """Schedule full reindex of the package that exceeded time budget.
+
+    Every package has at most one pending job. If the job is already in
+    the queue, it will index deferred resources as well.
+    """
+    from . import jobs
+
+    log.info(
+        "Time budget for package %s is exhausted. Defer %d resources: %s",
+        package_id,
+        len(resources),
+        [res["id"] for res in resources],
+    )
+    job_id = get_job_id(package_id)
+    try:
+        if _is_job_queued(job_id):
+            log.debug("Package %s is already queued", package_id)
+            return
+
+        tk.enqueue_job(
+            jobs.reindex_package,
+            [package_id],
+            title=f"Index resources of package {package_id}",
+            rq_kwargs={"job_id": job_id},
+        )
+    except Exception:
+        log.exception("Cannot defer indexation of package %s", package_id)
+
+
+def get_job_id(package_id: str) -> str:
+    """ID of the background job that indexes the package."""
+    return f"resource-indexer-{package_id}"
+
+
+def _is_job_queued(job_id: str) -> bool:
+    from ckan.lib.jobs import job_from_id
+
+    try:
+        job = job_from_id(job_id)
+    except KeyError:
+        return False
+    return job.get_status() == "queued"
+
+
 def index_resource(res: dict[str, Any], pkg_dict: dict[str, Any]):
-    """Extract the data from resource and merge it into the package."""
+    """Extract the data from resource and merge it into the package.
+
+    When content cache is enabled, data extracted from the same version of
+    the resource is reused and the file is not touched at all.
+    """
+    cache = get_content_cache()
+    if cache and _merge_cached(cache, res, pkg_dict):
+        return
+
     removable_path = _get_removable_filepath_for_resource(res)
     if not removable_path:
         return
@@ -56,11 +166,12 @@ def index_resource(res: dict[str, Any], pkg_dict: dict[str, Any]):
     with removable_path as path:
         assert path, "Path cannot be missing"
 
+        # temporary files belong to the indexer, so nobody truncates them
+        # while they are mapped
+        use_mmap = isinstance(removable_path, RemovablePath)
         try:
-            handler = _get_handler(res)
-            if handler:
-                chunks = handler.extract_indexable_chunks(path)
-                handler.merge_chunks_into_index(pkg_dict, chunks)
+            with ResourceFile(path, use_mmap or config.mmap_uploads()) as file:
+                _index_file(res, file, pkg_dict, cache)
         except Exception:
             log.exception(
                 (
@@ -74,14 +185,420 @@ def index_resource(res: dict[str, Any], pkg_dict: dict[str, Any]):
             )
 
 
-def _get_handler(res):
+def _index_file(
+    res: dict[str, Any],
+    file: ResourceFile,
+    pkg_dict: dict[str, Any],
+    cache: Optional[metrics.MetricsStore] = None,
+):
+    routed = route_by_content(res, file)
+    if not routed:
+        if cache:
+            # remember that resource must be skipped
+            _cache_content(cache, res, "", [])
+        return
+
+    stats = get_stats_store()
+    token = current_resource.set(routed)
+    try:
+        handler = _select_handler(routed, file, stats)
+        if not handler:
+            return
+
+        if not cache and not stats:
+            chunks = extract_chunks(handler, file)
+            handler.merge_chunks_into_index(pkg_dict, chunks)
+            return
+
+        start = time.perf_counter()
+        recorder = None
+        try:
+            chunks = extract_chunks(handler, file)
+            if isinstance(chunks, dict):
+                handler.merge_chunks_into_index(pkg_dict, chunks)
+                recorded = chunks
+            else:
+                recorder = _ChunkRecorder(chunks, keep=bool(cache))
+                handler.merge_chunks_into_index(pkg_dict, recorder)
+                recorded = recorder.items if recorder.complete else None
+        except Exception as e:
+            if stats:
+                _record_stats(stats, routed, file, handler, start, None, e)
+            raise
+
+        if stats:
+            if recorder is None:
+                recorder = _ChunkRecorder.measure(
+                    f"{k}{v}" for k, v in chunks.items()
+                )
+            _record_stats(stats, routed, file, handler, start, recorder)
+
+        if cache and recorded is not None:
+            _cache_content(cache, res, routed.get("format", ""), recorded)
+    finally:
+        current_resource.reset(token)
+
+
+def get_stats_store() -> Optional[metrics.MetricsStore]:
+    """Storage for extraction statistics, if collection is enabled."""
+    if not config.collect_stats():
+        return None
+
+    from . import metrics
+
+    return metrics.get_store()
+
+
+def get_handler_name(handler: Any) -> str:
+    return getattr(handler, "name", None) or type(handler).__name__
+
+
+def _select_handler(
+    res: dict[str, Any],
+    file: ResourceFile,
+    stats: Optional[metrics.MetricsStore],
+) -> Any:
+    """Choose the handler, taking results of previous attempts into account.
+
+    Handlers that produced no text from the same content are either
+    replaced by the next suitable handler, or resource is skipped,
+    depending on the enabled policies.
+    """
+    handlers = _get_handlers(res)
+    if not handlers:
+        return None
+
+    best = handlers[-1]
+    reroute = config.stats_reroute_empty()
+    skip = config.stats_skip_empty()
+    if not stats or not (reroute or skip):
+        return best
+
+    import sqlite3
+
+    try:
+        empty = stats.empty_handlers(res["id"], file.digest())
+    except sqlite3.Error as e:
+        log.warning("Cannot read statistics of %s: %s", res["id"], e)
+        return best
+
+    if get_handler_name(best) not in empty:
+        return best
+
+    if reroute:
+        alternatives = [
+            h for h in handlers if get_handler_name(h) not in empty
+        ]
+        if alternatives:
+            log.info(
+                "%s produced nothing from resource %s. Use %s instead",
+                get_handler_name(best),
+                res["id"],
+                get_handler_name(alternatives[-1]),
+            )
+            return alternatives[-1]
+
+    if skip:
+        log.debug("Skip resource %s that produced nothing", res["id"])
+        return None
+
+    return best
+
+
+def _record_stats(
+    stats: metrics.MetricsStore,
+    res: dict[str, Any],
+    file: ResourceFile,
+    handler: Any,
+    start: float,
+    recorder: Optional[_ChunkRecorder],
+    error: Optional[Exception] = None,
+):
+    import sqlite3
+
+    chars = recorder.chars if recorder else 0
+    try:
+        stats.record_resource(
+            res["id"],
+            get_handler_name(handler),
+            file.digest(),
+            res.get("format", ""),
+            chars,
+            recorder.printable_ratio if recorder else None,
+            f"{type(error).__name__}: {error}" if error else None,
+            time.perf_counter() - start,
+        )
+    except sqlite3.Error as e:
+        log.warning("Cannot record statistics of %s: %s", res["id"], e)
+
+
+def get_content_cache() -> Optional[metrics.MetricsStore]:
+    """Storage for extracted content, if caching is enabled."""
+    if not config.cache_content():
+        return None
+
+    from . import metrics
+
+    return metrics.get_store()
+
+
+def get_fingerprint(res: dict[str, Any]) -> str:
+    """Hash that changes when the file of the resource changes."""
+    data = json.dumps([res.get(f) for f in FINGERPRINT_FIELDS], default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def invalidate_content(ids: Iterable[str]):
+    """Remove cached content of resources."""
+    import sqlite3
+
+    cache = get_content_cache()
+    if not cache:
+        return
+
+    try:
+        cache.drop_content(ids)
+    except sqlite3.Error as e:
+        log.warning("Cannot invalidate cached content: %s", e)
+
+
+def update_resource_field(res: dict[str, Any], force: bool = False) -> str:
+    """Replace the content of the single resource inside the search index.
+
+    Content of the resource is sent to Solr as an atomic update of the
+    resource's field. Package document is not rebuilt and other resources
+    are not touched. Inactive or non-indexable resources are removed from
+    the field.
+
+    Cached content is reused, unless `force` is set. Cache is already
+    invalidated when the file is uploaded or the resource is deleted, and
+    other changes of the file modify the fingerprint of the resource.
+
+    Works only with `field` content mode. Solr atomic updates require all
+    fields of the document to be stored(or to be copyField destinations).
+
+    Returns:
+        new content of the resource's field
+    """
+    from ckan.lib.search.common import make_connection
+
+    if config.content_mode() != config.ContentMode.field:
+        raise exc.ResourceIndexerError(
+            "Atomic updates require `field` content mode"
+        )
+
+    if force:
+        invalidate_content([res["id"]])
+
+    data = {"id": res["package_id"]}
+    if res.get("state", "active") == "active" and any(
+        select_indexable_resources([res])
+    ):
+        index_resource(res, data)
+
+    field = get_resource_field(res["id"])
+    text = data.get(field, "")
+
+    make_connection().add(
+        [{"index_id": get_index_id(res["package_id"]), field: text}],
+        fieldUpdates={field: "set"},
+        commit=tk.asbool(tk.config.get("ckan.search.solr_commit", True)),
+    )
+    return text
+
+
+def delete_child_documents(package_id: str):
+    """Remove child documents of the package from the search index.
+
+    CKAN removes only the package document itself, so children of the
+    deleted package must be removed separately.
+    """
+    from ckan.lib.search.common import make_connection
+
+    make_connection().delete(
+        q="_root_:{} AND entity_type:resource".format(
+            get_index_id(package_id)
+        ),
+        commit=tk.asbool(tk.config.get("ckan.search.solr_commit", True)),
+    )
+
+
+def _merge_cached(
+    cache: metrics.MetricsStore, res: dict[str, Any], pkg_dict: dict[str, Any]
+) -> bool:
+    import sqlite3
+
+    try:
+        cached = cache.get_content(res["id"], get_fingerprint(res))
+    except sqlite3.Error as e:
+        log.warning("Cannot read cached content of %s: %s", res["id"], e)
+        return False
+
+    if cached is None:
+        return False
+
+    fmt, chunks = cached
+    if not fmt:
+        log.debug("Skip resource %s according to cache", res["id"])
+        return True
+
+    routed = res if fmt == res.get("format") else dict(res, format=fmt)
+    token = current_resource.set(routed)
+    try:
+        handler = get_handler(routed)
+        if handler:
+            handler.merge_chunks_into_index(pkg_dict, chunks)
+    finally:
+        current_resource.reset(token)
+
+    return True
+
+
+def _cache_content(
+    cache: metrics.MetricsStore, res: dict[str, Any], fmt: str, chunks: Any
+):
+    import sqlite3
+
+    try:
+        cache.set_content(res["id"], get_fingerprint(res), fmt, chunks)
+    except (TypeError, ValueError, sqlite3.Error) as e:
+        log.debug("Cannot cache content of %s: %s", res["id"], e)
+
+
+class _ChunkRecorder:
+    """Iterable that measures text chunks passing through it.
+
+    Chunks are remembered only when `keep` is set. They are dropped if any
+    of them is not a string, or if the indexer did not consume all of them.
+    Text of archive members is measured while members are merged.
+    """
+
+    def __init__(self, chunks: Iterable[Any], keep: bool = True):
+        self.chunks = chunks
+        self.items: Optional[list[str]] = [] if keep else None
+        self.chars = 0
+        self.unprintable = 0
+        self.complete = False
+
+    @classmethod
+    def measure(cls, chunks: Iterable[str]) -> _ChunkRecorder:
+        recorder = cls(chunks, keep=False)
+        for _chunk in recorder:
+            pass
+        return recorder
+
+    @property
+    def printable_ratio(self) -> Optional[float]:
+        if not self.chars:
+            return None
+        return 1 - self.unprintable / self.chars
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                self._count(chunk)
+                if self.items is not None:
+                    self.items.append(chunk)
+            else:
+                self.items = None
+                chunk = self._unwrap(chunk)
+            yield chunk
+
+        self.complete = True
+
+    def _count(self, chunk: str):
+        self.chars += len(chunk)
+        self.unprintable += sum(1 for _m in RE_UNPRINTABLE.finditer(chunk))
+
+    def _unwrap(self, chunk: Any) -> Any:
+        from . import archive
+
+        if not isinstance(chunk, archive.Member):
+            return chunk
+
+        if isinstance(chunk.chunks, dict):
+            for key, value in chunk.chunks.items():
+                self._count(f"{key}{value}")
+            return chunk
+
+        return chunk._replace(chunks=self._nested(chunk.chunks))
+
+    def _nested(self, chunks: Iterable[Any]) -> Iterable[Any]:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                self._count(chunk)
+            else:
+                chunk = self._unwrap(chunk)
+            yield chunk
+
+
+def extract_chunks(handler: Any, file: ResourceFile) -> Any:
+    """Extract data using the buffer, if indexer supports it."""
+    extractor = getattr(handler, "extract_indexable_chunks_from_buffer", None)
+    if extractor:
+        return extractor(file)
+    return handler.extract_indexable_chunks(file.path)
+
+
+def route_by_content(
+    res: dict[str, Any], file: ResourceFile
+) -> Optional[dict[str, Any]]:
+    """Check the real type of the file before extracting data from it.
+
+    If content does not match declared format, resource is either indexed
+    as the detected format(when it's indexable), or skipped.
+    """
+    if not config.sniff_content():
+        return res
+
+    try:
+        detected = file.sniff()
+    except Exception:
+        log.exception("Cannot detect type of the file %s", file.path)
+        return res
+
+    fmt = res.get("format", "")
+    if detected.empty:
+        log.debug("Skip empty file from resource %s", res["id"])
+        return None
+
+    if detected.is_compatible(fmt):
+        return res
+
+    actual = detected.format
+    if actual and actual in config.indexable_formats():
+        log.info(
+            "Resource %s declared as %s, but contains %s. Index it as %s",
+            res["id"],
+            fmt,
+            detected.mimetype,
+            actual,
+        )
+        return dict(res, format=actual)
+
+    log.info(
+        "Skip resource %s declared as %s, because it contains %s",
+        res["id"],
+        fmt,
+        detected.mimetype,
+    )
+    return None
+
+
+def get_handler(res: dict[str, Any]) -> Any:
     """Handler is a plugin that provides a method to index resource.
 
     Based on Weight we are returning the most valuable one.
     """
+    handlers = _get_handlers(res)
+    return handlers[-1] if handlers else None
+
+
+def _get_handlers(res) -> list[Any]:
+    """All suitable handlers, from the least to the most valuable."""
     from ckanext.resource_indexer.interface import IResourceIndexer
 
-    handlers = [
+    return [
         plugin
         for (weight, plugin) in sorted(
             [
@@ -93,7 +610,124 @@ def _get_handler(res):
         if plugin and weight > Weight.skip
     ]
 
-    return handlers[-1] if handlers else None
+
+class ContentCapture:
+    """Lazy view of the content sent to the index.
+
+    Instead of copying indexed text, capture keeps a reference to the last
+    modified field together with offsets of fragments added by every
+    resource. Text is materialized only for the requested window, when
+    indexation fails.
+
+    Offsets are computed as if values of multi-valued field were joined
+    using a single space.
+    """
+
+    def __init__(self):
+        self.data: Optional[dict[str, Any]] = None
+        self.field: Optional[str] = None
+        self.fragments: list[tuple[int, int, Optional[str]]] = []
+
+    def record(
+        self,
+        data: dict[str, Any],
+        field: str,
+        text: str,
+        res_id: Optional[str],
+    ):
+        if data is not self.data or field != self.field:
+            self.data = data
+            self.field = field
+            self.fragments = []
+
+        value = data[field]
+        if isinstance(value, list):
+            end = sum(map(len, value)) + len(value) - 1
+        else:
+            end = len(value)
+
+        self.fragments.append((end - len(text), end, res_id))
+
+    def window(self, start: int, end: int) -> str:
+        """Materialize the part of the captured field."""
+        if self.data is None or self.field is None:
+            return ""
+
+        value = self.data.get(self.field, "")
+        if not isinstance(value, list):
+            return str(value)[start:end]
+
+        parts = []
+        offset = 0
+        for idx, item in enumerate(value):
+            if idx:
+                # separator between items
+                if start <= offset < end:
+                    parts.append(" ")
+                offset += 1
+
+            item_end = offset + len(item)
+            if item_end > start and offset < end:
+                parts.append(item[max(0, start - offset) : end - offset])
+            if item_end >= end:
+                break
+
+            offset = item_end
+
+        return "".join(parts)
+
+    def resource_at(self, offset: int) -> Optional[str]:
+        """ID of the resource that produced content at the given offset."""
+        for start, end, res_id in self.fragments:
+            if start <= offset < end:
+                return res_id
+
+
+@contextmanager
+def capture_content():
+    """With-context that tracks content sent to the index.
+
+    Capture is disabled by default, so that web requests do not pay for
+    it. Use it only where failed indexation can be explained, e.g. CLI.
+    """
+    capture = ContentCapture()
+    token = debug_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        debug_capture.reset(token)
+
+
+def _capture(data: dict[str, Any], field: str, text: str):
+    capture = debug_capture.get()
+    if capture is None:
+        return
+
+    res = current_resource.get()
+    capture.record(data, field, text, res["id"] if res else None)
+
+
+class _LastContent:
+    """Read-only replacement of the removed `debug_last_content` variable.
+
+    Returns the field captured by `capture_content`. Outside of the capture
+    context content is not tracked and empty string is returned.
+    """
+
+    def get(self, default: str = "") -> str:
+        warnings.warn(
+            "`debug_last_content` is deprecated. Use `capture_content()`",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        capture = debug_capture.get()
+        if capture is None or capture.data is None:
+            return default
+        return capture.window(0, sys.maxsize)
+
+
+# deprecated: use `capture_content()`
+debug_last_content = _LastContent()
 
 
 class StaticPath:
@@ -112,6 +746,106 @@ class StaticPath:
         pass
 
 
+class ResourceFile:
+    """Read-only view of the resource file.
+
+    File is opened once, and content is exposed as a memoryview. Sniffing,
+    hashing and extraction use views of the same buffer instead of reading
+    the file again and again.
+
+        >>> with ResourceFile(path) as file:
+        >>>     header = file.head(1024)
+        >>>     text = str(file.buffer, "utf8")
+
+    With `use_mmap` file is memory-mapped. Otherwise, content is read into
+    memory when the buffer or digest is requested for the first time, while
+    header is read without loading the whole file. Mapped file must
+    not be truncated until it's closed: access to the missing part of the
+    mapping kills the process with SIGBUS.
+
+    Views must not be used after the file is closed.
+    """
+
+    def __init__(self, path: str, use_mmap: bool = True):
+        self.path = path
+        self.use_mmap = use_mmap
+        self._file: Optional[IO[bytes]] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._buffer: Optional[memoryview] = None
+        self._digest: Optional[str] = None
+        self._sniff: Optional[sniff.Sniff] = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def open(self):
+        self._file = open(self.path, "rb")
+        if not os.fstat(self._file.fileno()).st_size:
+            # empty files cannot be mapped
+            self._buffer = memoryview(b"")
+        elif self.use_mmap:
+            self._mmap = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+            self._buffer = memoryview(self._mmap)
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # someone still holds a view. Mapping is closed when the
+                # last view is garbage-collected
+                log.debug("Views of %s are still in use", self.path)
+            self._mmap = None
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def buffer(self) -> memoryview:
+        assert self._file is not None, "File is not opened"
+        if self._buffer is None:
+            self._file.seek(0)
+            self._buffer = memoryview(self._file.read())
+        return self._buffer
+
+    def head(self, size: int) -> memoryview:
+        if self._buffer is None:
+            assert self._file is not None, "File is not opened"
+            self._file.seek(0)
+            return memoryview(self._file.read(size))
+        return self._buffer[:size]
+
+    def digest(self) -> str:
+        """SHA256 of the file content."""
+        if self._digest is None:
+            self._digest = self._hash().hexdigest()
+        return self._digest
+
+    def _hash(self) -> Any:
+        # content is loaded for hashing and then reused by extraction,
+        # instead of reading the file twice
+        return hashlib.sha256(self.buffer)
+
+    def sniff(self) -> sniff.Sniff:
+        """Type of the file content."""
+        if self._sniff is None:
+            self._sniff = sniff.sniff(
+                self.path, bytes(self.head(sniff.SNIFF_SIZE))
+            )
+        return self._sniff
+
+
 class RemovablePath(StaticPath):
     """With-context for a filepath that must be removed on exit.
 
@@ -143,6 +877,8 @@ def _get_removable_filepath_for_resource(
 
 
     """
+    from ckan.lib.uploader import get_resource_uploader
+
     res_id = res["id"]
     res_url = res["url"]
 
@@ -173,7 +909,22 @@ def _download_remote_file(res_id: str, url: str) -> Optional[str]:
     """
     Downloads remote resource and save it as temporary file
     Returns path to this file
+
+    Requests to hosts that failed repeatedly are skipped for a while, and
+    the number of parallel requests to the same host is limited.
     """
+    try:
+        with hosts.get_registry().slot(url) as slot:
+            return _fetch_remote_file(res_id, url, slot)
+    except exc.HostUnavailableError as e:
+        log.info("Skip resource %s with url <%s>: %s", res_id, url, e)
+
+
+def _fetch_remote_file(
+    res_id: str, url: str, slot: hosts.HostSlot
+) -> Optional[str]:
+    import requests
+
     try:
         resp = requests.get(
             url,
@@ -182,33 +933,51 @@ def _download_remote_file(res_id: str, url: str) -> Optional[str]:
             stream=True,
         )
     except Exception as e:
+        slot.failure()
         log.warn(
             "Unable to make GET request for resource {} with url <{}>: {}"
             .format(res_id, url, e)
         )
         return
 
-    if not resp.ok:
-        log.warn(
-            "Unsuccessful GET request for resource {} with url <{}>.          "
-            "   Status code: {}".format(res_id, url, resp.status_code),
-        )
+    with resp:
+        if not resp.ok:
+            if resp.status_code == 429 or resp.status_code >= 500:
+                slot.failure(
+                    hosts.parse_retry_after(resp.headers.get("retry-after"))
+                )
+            log.warn(
+                "Unsuccessful GET request for resource {} with url <{}>.      "
+                "       Status code: {}".format(res_id, url, resp.status_code),
+            )
 
-        return
+            return
 
-    try:
-        size = int(resp.headers.get("content-length", 0))
-    except ValueError:
-        log.warn("Incorrect Content-length header from url <{}>".format(url))
-        return
+        try:
+            size = int(resp.headers.get("content-length", 0))
+        except ValueError:
+            log.warn(
+                "Incorrect Content-length header from url <{}>".format(url)
+            )
+            return
+
+        max_size = _get_remote_res_max_size()
+        if size >= max_size:
+            return
 
-    if 0 < size < _get_remote_res_max_size():
+        # without Content-Length(i.e, chunked response) the size is checked
+        # while the file is downloaded
+        received = 0
         dest = tempfile.NamedTemporaryFile(delete=False)
         try:
             with dest:
                 for chunk in resp.iter_content(1024 * 64):
+                    received += len(chunk)
+                    if received >= max_size:
+                        break
                     dest.write(chunk)
         except requests.exceptions.RequestException as e:
+            slot.failure()
             log.error(
                 "Cannot index remote resource {} with url <{}>: {}".format(
                     res_id, url, e
@@ -216,6 +985,11 @@ def _download_remote_file(res_id: str, url: str) -> Optional[str]:
             )
             os.remove(dest.name)
             return
+
+        if not 0 < received < max_size:
+            os.remove(dest.name)
+            return
+
         return dest.name
 
 
@@ -226,6 +1000,15 @@ def _get_remote_res_max_size():
 def merge_text_chunks(
     pkg_dict: dict[str, Any], chunks: Iterable[str]
 ) -> Optional[str]:
+    res = current_resource.get()
+    mode = config.content_mode()
+
+    if res and mode == config.ContentMode.field:
+        return _merge_into_resource_field(pkg_dict, res, chunks)
+
+    if res and mode == config.ContentMode.child:
+        return _merge_into_child_document(pkg_dict, res, chunks)
+
     index_field = config.index_field()
     if not index_field:
         index_field = "text"
@@ -239,20 +1022,117 @@ def merge_text_chunks(
 
     if isinstance(current, list):
         pkg_dict[index_field].append(str_index)
-        debug_last_content.set(" ".join(pkg_dict[index_field]))
 
     else:
         pkg_dict[index_field] = " ".join([str(current), str_index])
-        debug_last_content.set(pkg_dict[index_field])
+
+    _capture(pkg_dict, index_field, str_index)
+
+    _append_text(pkg_dict, get_format_field(res), str_index)
 
     return str_index
 
 
-def extract_pdf(path: str) -> Iterable[str]:
-    import pdftotext
+def _merge_into_resource_field(
+    pkg_dict: dict[str, Any], res: dict[str, Any], chunks: Iterable[str]
+) -> Optional[str]:
+    str_index = "".join(chunks)
+    if not str_index:
+        return
+
+    field = get_resource_field(res["id"])
+    _append_text(pkg_dict, field, str_index)
+    _capture(pkg_dict, field, str_index)
+
+    _append_text(pkg_dict, get_format_field(res), str_index)
+
+    return str_index
+
+
+def _merge_into_child_document(
+    pkg_dict: dict[str, Any], res: dict[str, Any], chunks: Iterable[str]
+) -> Optional[str]:
+    str_index = "".join(chunks)
+    if not str_index:
+        return
+
+    children = pkg_dict.setdefault("_childDocuments_", [])
+    child = next((c for c in children if c["id"] == res["id"]), None)
+    if child is None:
+        child = {
+            "id": res["id"],
+            "index_id": get_index_id(f"{pkg_dict['id']}/{res['id']}"),
+            "site_id": tk.config.get("ckan.site_id"),
+            "entity_type": "resource",
+            "package_id": pkg_dict["id"],
+            "res_format": res.get("format", ""),
+            "text": [],
+        }
+        children.append(child)
+
+    child["text"].append(str_index)
+    _capture(child, "text", str_index)
+
+    _append_text(child, get_format_field(res), str_index)
+
+    return str_index
+
+
+def _append_text(data: dict[str, Any], field: Optional[str], text: str):
+    """Add text to the single-valued field.
+
+    Dynamic fields, like `extras_*`, are usually single-valued, so multiple
+    fragments are joined instead of being collected into the list.
+    """
+    if not field:
+        return
+
+    previous = data.get(field)
+    data[field] = " ".join([previous, text]) if previous else text
+
+
+def get_resource_field(res_id: str) -> str:
+    """Name of the index field for the content of the specific resource."""
+    return config.resource_field_prefix() + RE_FIELD_UNSAFE.sub(
+        "_", res_id.lower()
+    )
 
+
+def get_index_id(id_: str) -> str:
+    """Unique ID of Solr document, computed in the same way as CKAN does."""
+    return hashlib.md5(
+        "{}{}".format(id_, tk.config.get("ckan.site_id")).encode()
+    ).hexdigest()
+
+
+def get_format_field(res: Optional[dict[str, Any]]) -> Optional[str]:
+    """Name of the index field for content of resources with given format.
+
+    Returns None if per-format fields are not enabled or resource has no
+    format.
+    """
+    prefix = config.format_field_prefix()
+    if not prefix or not res:
+        return None
+
+    fmt = RE_FIELD_UNSAFE.sub("_", res.get("format", "").lower())
+    if not fmt:
+        return None
+
+    return prefix + fmt
+
+
+def extract_pdf(path: str) -> Iterable[str]:
     processor = config.pdf_processor()
 
+    for content in read_pdf_pages(path):
+        yield processor(content)
+
+
+def read_pdf_pages(path: str) -> Iterable[str]:
+    """Read the text layer of every page without any post-processing."""
+    import pdftotext
+
     with open(path, "rb") as source:
         try:
             pdf_content = pdftotext.PDF(source)
@@ -263,10 +1143,7 @@ def extract_pdf(path: str) -> Iterable[str]:
 
     for page in pdf_content:
         # normalize null-terminated strings that appear in old versions of poppler
-        content = page.rstrip("\x00")
-        processed = processor(content)
-
-        yield processed
+        yield page.rstrip("\x00")
 
 
 def extract_plain(path) -> Iterable[str]:
@@ -277,6 +1154,10 @@ def extract_plain(path) -> Iterable[str]:
     yield content
 
 
+def extract_plain_buffer(file: ResourceFile) -> Iterable[str]:
+    yield str(file.buffer, "utf8", errors="replace")
+
+
 def extract_json(path) -> dict[str, Any]:
     with open(path) as f:
         data = json.load(f)
@@ -287,17 +1168,34 @@ def extract_json(path) -> dict[str, Any]:
     return {key(k): value(v) for k, v in data.items()}
 
 
-def get_boost_string():
+def get_boost_string() -> Optional[str]:
+    """Compute additions to `qf` search parameter.
+
+    Depends only on config, so it's supposed to be computed once, when the
+    plugin is configured, instead of doing it for every search request.
+    """
+    boosts = []
     field = config.index_field()
+    if field:
+        boosts.append((field, config.boost()))
+
+    for fmt, boost in config.format_boost().items():
+        field = get_format_field({"format": fmt})
+        if field:
+            boosts.append((field, boost))
+
+    parts = [
+        f"{field}^{_format_boost(boost)}"
+        for field, boost in boosts
+        if boost != 1
+    ]
+    return " ".join(parts) or None
 
-    boost = config.boost()
 
-    if not field or boost == 1:
-        return
+def _format_boost(boost: float) -> str:
     if boost.is_integer():
-        boost = int(boost)
-
-    return f"{field}^{boost}"
+        return str(int(boost))
+    return str(boost)
 
 
 def bypass_indexation() -> bool:
@@ -310,6 +1208,26 @@ def bypass_indexation() -> bool:
     )
 
 
+def time_budget() -> float:
+    """Seconds available for indexation of resources of a single package.
+
+    Returns 0 when time is not limited.
+    """
+    if not budget_flag.get():
+        return 0
+    return config.index_time_budget()
+
+
+@contextmanager
+def unlimited_indexation():
+    """With-context that ignores time budget."""
+    token = budget_flag.set(False)
+    try:
+        yield
+    finally:
+        budget_flag.reset(token)
+
+
 @contextmanager
 def disabled_indexation():
     """With-context that disables indexation of the resource."""
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import abc
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+import ckan.plugins.toolkit as tk
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+TABLE_NAME = "resource_indexer_queue"
+REDIS_PREFIX = "ckanext-resource-indexer:queue"
+
+# Redis score combines priority and sequence number of the item. Both parts
+# are integers and the score never exceeds 2**53, so it's represented by
+# Redis' double-precision score without rounding
+REDIS_PRIORITY_STEP = 2**40
+MAX_PRIORITY = 2**12 - 1
+
+_memory_queue: Optional[MemoryQueue] = None
+
+
+class WorkQueue(abc.ABC):
+    """Shared queue of package IDs waiting for indexation.
+
+    Workers claim items for the limited period of time(lease). Claimed item
+    is not available for other workers until it's acknowledged, or until
+    lease expires - in this case worker is considered dead and item is
+    returned to the queue.
+
+    Items with higher priority are claimed first. Items with the same
+    priority are claimed in the order they were enqueued.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+
+    @abc.abstractmethod
+    def enqueue(self, ids: Iterable[str], priority: int = 0) -> int:
+        """Add items to the queue, replacing existing ones.
+
+        Returns:
+            number of added items
+        """
+
+    @abc.abstractmethod
+    def claim(self, worker: str, size: int, lease: float) -> list[str]:
+        """Take up to `size` items for `lease` seconds."""
+
+    @abc.abstractmethod
+    def ack(self, worker: str, ids: Iterable[str]):
+        """Remove processed items claimed by the worker."""
+
+    @abc.abstractmethod
+    def stats(self) -> dict[str, int]:
+        """Number of pending and claimed items."""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Remove all the items."""
+
+
+class MemoryQueue(WorkQueue):
+    """Queue that lives inside the current process.
+
+    Suitable for tests and for workers running as threads of a single
+    process.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        super().__init__(clock)
+        self.lock = threading.Lock()
+        # id -> [priority, order, owner, lease_until]
+        self.items: dict[str, list[Any]] = {}
+        self.counter = 0
+
+    def enqueue(self, ids: Iterable[str], priority: int = 0) -> int:
+        count = 0
+        with self.lock:
+            for id_ in ids:
+                self.counter += 1
+                count += 1
+                self.items[id_] = [priority, self.counter, None, None]
+        return count
+
+    def claim(self, worker: str, size: int, lease: float) -> list[str]:
+        now = self.clock()
+        with self.lock:
+            available = sorted(
+                (
+                    (-item[0], item[1], id_)
+                    for id_, item in self.items.items()
+                    if item[3] is None or item[3] < now
+                )
+            )[:size]
+
+            ids = [id_ for _p, _o, id_ in available]
+            for id_ in ids:
+                self.items[id_][2:] = [worker, now + lease]
+        return ids
+
+    def ack(self, worker: str, ids: Iterable[str]):
+        with self.lock:
+            for id_ in ids:
+                item = self.items.get(id_)
+                if item and item[2] == worker:
+                    del self.items[id_]
+
+    def stats(self) -> dict[str, int]:
+        now = self.clock()
+        with self.lock:
+            claimed = sum(
+                1
+                for item in self.items.values()
+                if item[3] is not None and item[3] >= now
+            )
+            return {"pending": len(self.items) - claimed, "claimed": claimed}
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class SqlQueue(WorkQueue):
+    """Queue stored in the database table.
+
+    Works with any database supported by SQLAlchemy. By default, CKAN's
+    database is used, so every node that has access to CKAN can take part
+    in indexation.
+
+    Table is never created implicitly. In CKAN's database it's created by
+    `ckan db upgrade -p resource_indexer`, in any other database - by
+    `create_table`(`ckan resource-indexer queue init`).
+    """
+
+    def __init__(self, url: str, clock: Callable[[], float] = time.time):
+        import sqlalchemy as sa
+
+        super().__init__(clock)
+        self.engine = sa.create_engine(url)
+        self.table = sa.Table(
+            TABLE_NAME,
+            sa.MetaData(),
+            sa.Column("package_id", sa.UnicodeText, primary_key=True),
+            sa.Column("priority", sa.Integer, nullable=False, default=0),
+            sa.Column("enqueued", sa.Float, nullable=False),
+            sa.Column("claimed_by", sa.UnicodeText),
+            sa.Column("lease_until", sa.Float),
+            sa.Column("attempts", sa.Integer, nullable=False, default=0),
+        )
+
+    def create_table(self):
+        self.table.create(self.engine, checkfirst=True)
+
+    def enqueue(self, ids: Iterable[str], priority: int = 0) -> int:
+        import sqlalchemy as sa
+
+        ids = list(dict.fromkeys(ids))
+        now = self.clock()
+        with self.engine.begin() as conn:
+            # continue after the last item, so that batches enqueued at the
+            # same moment keep their order
+            last = conn.execute(
+                sa.func.max(self.table.c.enqueued).select()
+            ).scalar()
+            if last is not None:
+                now = max(now, last + 1e-6)
+
+            for start in range(0, len(ids), 1000):
+                batch = ids[start : start + 1000]
+                conn.execute(
+                    self.table.delete().where(
+                        self.table.c.package_id.in_(batch)
+                    )
+                )
+                conn.execute(
+                    self.table.insert(),
+                    [
+                        {
+                            "package_id": id_,
+                            "priority": priority,
+                            # preserve order of items inside the batch
+                            "enqueued": now + (start + idx) * 1e-6,
+                            "attempts": 0,
+                        }
+                        for idx, id_ in enumerate(batch)
+                    ],
+                )
+        return len(ids)
+
+    def claim(self, worker: str, size: int, lease: float) -> list[str]:
+        import sqlalchemy as sa
+
+        c = self.table.c
+        now = self.clock()
+        lease_until = now + lease
+        available = sa.or_(c.lease_until.is_(None), c.lease_until < now)
+
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                self.table.select()
+                .where(available)
+                .order_by(c.priority.desc(), c.enqueued)
+                .limit(size)
+                .with_for_update(skip_locked=True)
+            ).fetchall()
+            ids = [row.package_id for row in rows]
+            if not ids:
+                return []
+
+            # condition is repeated, because databases without row-level
+            # locks(SQLite) may give the same rows to concurrent workers
+            conn.execute(
+                self.table.update()
+                .where(c.package_id.in_(ids))
+                .where(available)
+                .values(
+                    claimed_by=worker,
+                    lease_until=lease_until,
+                    attempts=c.attempts + 1,
+                )
+            )
+            rows = conn.execute(
+                self.table.select()
+                .where(c.package_id.in_(ids))
+                .where(c.claimed_by == worker)
+                .where(c.lease_until == lease_until)
+                .order_by(c.priority.desc(), c.enqueued)
+            ).fetchall()
+
+        return [row.package_id for row in rows]
+
+    def ack(self, worker: str, ids: Iterable[str]):
+        c = self.table.c
+        with self.engine.begin() as conn:
+            conn.execute(
+                self.table.delete()
+                .where(c.package_id.in_(list(ids)))
+                .where(c.claimed_by == worker)
+            )
+
+    def stats(self) -> dict[str, int]:
+        import sqlalchemy as sa
+
+        with self.engine.begin() as conn:
+            total, claimed = conn.execute(
+                sa.text(
+                    f"SELECT count(*), count(CASE WHEN lease_until >= :now"
+                    f" THEN 1 END) FROM {TABLE_NAME}"
+                ),
+                {"now": self.clock()},
+            ).fetchone()
+        return {"pending": total - claimed, "claimed": claimed}
+
+    def clear(self):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.delete())
+
+
+class RedisQueue(WorkQueue):
+    """Queue stored in Redis(or any Redis-compatible storage)."""
+
+    _claim_script = """
+    local pending, leases, owners, scores = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+    local now, size, lease_until, worker = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+
+    for _, id in ipairs(redis.call("ZRANGEBYSCORE", leases, "-inf", now)) do
+        redis.call("ZREM", leases, id)
+        redis.call("HDEL", owners, id)
+        redis.call("ZADD", pending, redis.call("HGET", scores, id), id)
+    end
+
+    local ids = redis.call("ZRANGE", pending, 0, tonumber(size) - 1)
+    for _, id in ipairs(ids) do
+        redis.call("ZREM", pending, id)
+        redis.call("ZADD", leases, lease_until, id)
+        redis.call("HSET", owners, id, worker)
+    end
+    return ids
+    """
+
+    _ack_script = """
+    local pending, leases, owners, scores = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+    local worker = ARGV[1]
+
+    for idx = 2, #ARGV do
+        local id = ARGV[idx]
+        if redis.call("HGET", owners, id) == worker then
+            redis.call("ZREM", leases, id)
+            redis.call("HDEL", owners, id)
+            redis.call("HDEL", scores, id)
+        end
+    end
+    """
+
+    def __init__(self, url: str, clock: Callable[[], float] = time.time):
+        import redis
+
+        super().__init__(clock)
+        self.conn = redis.Redis.from_url(url, decode_responses=True)
+        self.keys = [
+            f"{REDIS_PREFIX}:{name}"
+            for name in ["pending", "leases", "owners", "scores"]
+        ]
+        self.sequence = f"{REDIS_PREFIX}:sequence"
+        self.claim_script = self.conn.register_script(self._claim_script)
+        self.ack_script = self.conn.register_script(self._ack_script)
+
+    def enqueue(self, ids: Iterable[str], priority: int = 0) -> int:
+        if not -MAX_PRIORITY <= priority <= MAX_PRIORITY:
+            raise ValueError(f"Priority must be within +/-{MAX_PRIORITY}")
+
+        pending, leases, owners, scores = self.keys
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return 0
+
+        # reserve sequence numbers for the whole batch
+        first = self.conn.incrby(self.sequence, len(ids)) - len(ids) + 1
+        pipe = self.conn.pipeline()
+        for idx, id_ in enumerate(ids):
+            # lower score is claimed first
+            score = -priority * REDIS_PRIORITY_STEP + first + idx
+            pipe.zrem(leases, id_)
+            pipe.hdel(owners, id_)
+            pipe.hset(scores, id_, score)
+            pipe.zadd(pending, {id_: score})
+        pipe.execute()
+        return len(ids)
+
+    def claim(self, worker: str, size: int, lease: float) -> list[str]:
+        now = self.clock()
+        return self.claim_script(
+            keys=self.keys, args=[now, size, now + lease, worker]
+        )
+
+    def ack(self, worker: str, ids: Iterable[str]):
+        ids = list(ids)
+        if ids:
+            self.ack_script(keys=self.keys, args=[worker, *ids])
+
+    def stats(self) -> dict[str, int]:
+        pending, leases, _owners, _scores = self.keys
+        now = self.clock()
+        expired = self.conn.zcount(leases, "-inf", now)
+        return {
+            "pending": self.conn.zcard(pending) + expired,
+            "claimed": self.conn.zcard(leases) - expired,
+        }
+
+    def clear(self):
+        self.conn.delete(*self.keys, self.sequence)
+
+
+def get_queue() -> WorkQueue:
+    """Queue configured by `ckanext.resource_indexer.queue.url`."""
+    global _memory_queue
+
+    url = config.queue_url() or tk.config["sqlalchemy.url"]
+
+    if url.startswith("memory://"):
+        if _memory_queue is None:
+            _memory_queue = MemoryQueue()
+        return _memory_queue
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url)
+
+    return SqlQueue(url)